@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Per-phase timings of compile.py on real countries and scaled-up copies.
+
+    ./scripts/bench_compile.py                    # us, ca and in
+    ./scripts/bench_compile.py ca --scale 10      # also ca's sources copied 10 times
+    ./scripts/bench_compile.py --synthetic 1000000   # also a generated country
+
+Each dataset is compiled --repeat times in-process and the best time of
+each phase (parse, validate, merge, same_as, parents, required, unique,
+write) is kept.  Results are appended to a JSON lines history file, and
+the run fails if any phase is more than --threshold slower than the median
+of the last --baseline runs of the same dataset on this machine.
+"""
+import gc
+import os
+import csv
+import sys
+import json
+import time
+import socket
+import shutil
+import platform
+import argparse
+import datetime
+import tempfile
+import statistics
+import subprocess
+
+import compile
+import division_id
+import generate_synthetic
+
+PHASES = ['parse', 'validate', 'merge', 'same_as', 'parents', 'required', 'unique', 'write']
+
+
+def scale_sources(country, factor, root, src_root=os.curdir):
+    """
+    write factor copies of a country's sources under root
+
+    Copy i > 0 appends '~i' to every value below the country in every id
+    and sameAs, and to every unique field, so each copy is a distinct but
+    equally valid tree with the same shape.
+    """
+    unique_fields = set(compile.COUNTRY_UNIQUE_FIELDS.get(country, []))
+    src = os.path.join(src_root, 'identifiers', 'country-{}'.format(country))
+    dest = os.path.join(root, 'identifiers', 'country-{}'.format(country))
+
+    def suffix_id(id_, i):
+        parts = id_.split('/')
+        return '/'.join(parts[:2] + ['{}~{}'.format(part, i) for part in parts[2:]])
+
+    for dirpath, dirnames, files in os.walk(src):
+        for f in files:
+            if not f.endswith('.csv'):
+                continue
+            filename = os.path.join(dirpath, f)
+            out_dir = os.path.join(dest, os.path.relpath(dirpath, src))
+            os.makedirs(out_dir, exist_ok=True)
+            with open(filename, encoding='UTF-8') as fh:
+                rows = list(csv.reader(fh))
+            if not rows:
+                continue
+            header = rows[0] if rows and not rows[0][0].startswith('ocd-division/') else ['id', 'name']
+            body = rows[1:] if header is rows[0] else rows
+            columns = {name: index for index, name in enumerate(header)}
+            with open(os.path.join(out_dir, f), 'w', encoding='UTF-8') as out:
+                writer = csv.writer(out)
+                writer.writerow(header)
+                writer.writerows(body)
+                for i in range(1, factor):
+                    for row in body:
+                        if not row or row[0].count('/') < 2:
+                            continue  # the country itself is only needed once
+                        row = list(row)
+                        for name, index in columns.items():
+                            if index >= len(row) or not row[index]:
+                                continue
+                            if name in ('id', 'sameAs'):
+                                row[index] = suffix_id(row[index], i)
+                            elif name in unique_fields:
+                                row[index] = '{}~{}'.format(row[index], i)
+                        writer.writerow(row)
+
+
+def time_compile(country, root, repeat, unique_fields=None):
+    """ return (rows, errors, {phase: best seconds}) for compiling country under root """
+    best = {}
+    rows = errors = 0
+    output = os.path.join(tempfile.mkdtemp(prefix='bench_compile_'), 'country-{}.csv'.format(country))
+    try:
+        for _ in range(repeat):
+            division_id._parse_parent.cache_clear()
+            gc.collect()
+            timer = compile.PhaseTimer()
+            result = compile.compile_country(country, root=root, timer=timer, unique_fields=unique_fields)
+            with timer.phase('write'):
+                compile.write_csv(result, output)
+            rows = len(result.records)
+            errors = len(result.errors)
+            for phase in PHASES:
+                seconds = timer.seconds.get(phase, 0.0)
+                best[phase] = min(best.get(phase, seconds), seconds)
+            del result
+    finally:
+        shutil.rmtree(os.path.dirname(output))
+    return rows, errors, best
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def read_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='UTF-8') as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def find_regressions(record, history, baseline, threshold, min_seconds):
+    """ return (phase, seconds, baseline seconds) for phases slower than the baseline """
+    previous = [r for r in history if r['dataset'] == record['dataset'] and r['host'] == record['host']][-baseline:]
+    if not previous:
+        return []
+    regressions = []
+    for phase, seconds in record['phases'].items():
+        past = [r['phases'][phase] for r in previous if phase in r['phases']]
+        if not past:
+            continue
+        median = statistics.median(past)
+        if seconds > median * (1 + threshold) and seconds - median > min_seconds:
+            regressions.append((phase, seconds, median))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='time each phase of compile.py')
+    parser.add_argument('country', nargs='*', default=['us', 'ca', 'in'], help='countries to time')
+    parser.add_argument('--scale', type=int, action='append', default=[],
+                        help='also time copies of each country scaled by this factor (repeatable)')
+    parser.add_argument('--synthetic', type=int, action='append', default=[],
+                        help='also time a country generated by generate_synthetic.py with about this many '
+                             'divisions (repeatable)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per dataset, the best of which is kept')
+    parser.add_argument('--history', default='cache/bench_compile.jsonl', help='JSON lines file of past results')
+    parser.add_argument('--no_record', action='store_true', help="don't append this run to the history")
+    parser.add_argument('--baseline', type=int, default=5, help='past runs whose median is the baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='fail if a phase is this fraction slower than the baseline')
+    parser.add_argument('--min_seconds', type=float, default=0.05,
+                        help='ignore slowdowns smaller than this many seconds')
+    args = parser.parse_args()
+
+    datasets = []
+    scratch = tempfile.mkdtemp(prefix='bench_compile_sources_')
+    try:
+        for country in args.country:
+            if not os.path.isdir(os.path.join('identifiers', 'country-{}'.format(country))):
+                print('skipping {}: no identifiers/country-{}/'.format(country, country))
+                continue
+            datasets.append((country, country, os.curdir, None))
+            for factor in args.scale:
+                root = os.path.join(scratch, '{}x{}'.format(country, factor))
+                scale_sources(country, factor, root)
+                datasets.append(('{}x{}'.format(country, factor), country, root, None))
+
+        for divisions in args.synthetic:
+            root = os.path.join(scratch, 'synthetic-{}'.format(divisions))
+            generate_synthetic.Generator(root, divisions=divisions).generate()
+            datasets.append(('synthetic-{}'.format(divisions), 'zz', root, generate_synthetic.UNIQUE_FIELDS))
+
+        history = read_history(args.history)
+        records = []
+        failed = False
+        for name, country, root, unique_fields in datasets:
+            start = time.perf_counter()
+            rows, errors, phases = time_compile(country, root, args.repeat, unique_fields)
+            record = {
+                'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'host': socket.gethostname(),
+                'python': platform.python_version(),
+                'dataset': name,
+                'rows': rows,
+                'errors': errors,
+                'phases': {phase: round(seconds, 4) for phase, seconds in phases.items()},
+                'total': round(sum(phases.values()), 4),
+            }
+            records.append(record)
+
+            print('{} ({} divisions, {} errors, {:.1f}s to bench)'.format(
+                name, rows, errors, time.perf_counter() - start))
+            for phase in PHASES:
+                print('   {:<10} {:>8.3f}s'.format(phase, phases[phase]))
+            print('   {:<10} {:>8.3f}s'.format('total', record['total']))
+            for phase, seconds, median in find_regressions(record, history, args.baseline,
+                                                           args.threshold, args.min_seconds):
+                failed = True
+                print('   REGRESSION {}: {:.3f}s vs baseline {:.3f}s'.format(phase, seconds, median))
+    finally:
+        shutil.rmtree(scratch)
+
+    if not args.no_record and records:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        with open(args.history, 'a', encoding='UTF-8') as fh:
+            for record in records:
+                fh.write(json.dumps(record, sort_keys=True) + '\n')
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
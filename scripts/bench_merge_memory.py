@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Compare peak memory of the compile.py merge phase using the original
+dict-per-division structure and the column-oriented RecordStore.
+
+Each structure is measured in a fresh interpreter so peak RSS isn't
+shared between them:
+
+    ./scripts/bench_merge_memory.py us
+    ./scripts/bench_merge_memory.py zz --root /tmp/synthetic   # see generate_synthetic.py
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import subprocess
+import collections
+
+import compile
+
+
+def merge_dicts(rows_by_file):
+    """ the structure compile.py used before RecordStore """
+    ids = collections.defaultdict(dict)
+    sources = collections.defaultdict(list)
+    for filename, rows in rows_by_file:
+        for row in rows:
+            id_record = ids[row['id']]
+            for key, val in row.items():
+                if val and key not in id_record:
+                    id_record[key] = val
+            sources[row['id']].append(filename)
+    return ids, sources
+
+
+def merge_store(rows_by_file):
+    ids = compile.RecordStore()
+    for filename, rows in rows_by_file:
+        for row in rows:
+            ids.add(row, filename)
+    return ids
+
+
+def iter_sources(country, root=os.curdir):
+    path = os.path.join(root, 'identifiers', 'country-{}'.format(country))
+    filenames = sorted(os.path.relpath(os.path.join(dirpath, f), root)
+                       for dirpath, dirnames, files in os.walk(path)
+                       for f in files if f.endswith('.csv'))
+    for filename in filenames:
+        source = compile.read_source(filename, root=root, verbose=False)
+        yield filename, [dict(zip(source.fieldnames, values)) for values in source.rows]
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_one(country, structure, root=os.curdir):
+    before = max_rss_mb()
+    start = time.perf_counter()
+    merge = merge_dicts if structure == 'dict' else merge_store
+    merged = merge(iter_sources(country, root))
+    elapsed = time.perf_counter() - start
+    print('{} {:.1f} {:.1f} {:.2f}'.format(structure, before, max_rss_mb(), elapsed))
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='peak RSS of the compile merge phase')
+    parser.add_argument('country', nargs='?', default='us', help='country to merge')
+    parser.add_argument('--root', default=os.curdir, help='directory containing identifiers/')
+    parser.add_argument('--structure', choices=('dict', 'store'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.structure:
+        run_one(args.country, args.structure, args.root)
+        return
+
+    print('{:<8} {:>14} {:>14} {:>10}'.format('merge', 'peak RSS (MB)', 'merge (MB)', 'seconds'))
+    for structure in ('dict', 'store'):
+        out = subprocess.run([sys.executable, __file__, args.country, '--root', args.root, '--structure', structure],
+                             check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        _, before, peak, elapsed = out.split()
+        print('{:<8} {:>14.1f} {:>14.1f} {:>10}'.format(
+            structure, float(peak), float(peak) - float(before), elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of division_id.parse_id against the regex validation and
+rsplit/split parsing compile.py used before it.
+
+    ./scripts/bench_parse_id.py
+"""
+import re
+import csv
+import glob
+import time
+import argparse
+
+import division_id
+
+OLD_ID_REGEX = r'^ocd-division/(country|region):[a-z]{2}(/[^\W\d]+[-]?[^\W\d]+:[\w.~-]+)*$'
+
+
+def old_parse(id_):
+    id_regex = re.compile(OLD_ID_REGEX, re.U)
+    if not (id_regex.match(id_) and id_.lower() == id_):
+        raise ValueError('invalid id: ' + id_)
+    parent, endpiece = id_.rsplit('/', 1)
+    return parent, endpiece.split(':')[0]
+
+
+def new_parse(id_):
+    parsed = division_id.parse_id(id_)
+    return parsed.parent, parsed.type
+
+
+def load_ids(pattern):
+    ids = []
+    for filename in sorted(glob.glob(pattern)):
+        with open(filename, encoding='UTF-8') as fh:
+            ids.extend(row['id'] for row in csv.DictReader(fh))
+    return ids
+
+
+def best_of(func, ids, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        division_id._parse_parent.cache_clear()
+        start = time.perf_counter()
+        for id_ in ids:
+            func(id_)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark OCD-ID parsing')
+    parser.add_argument('--ids', default='identifiers/country-*.csv', help='glob of compiled CSVs to read ids from')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--adversarial_length', type=int, default=5000,
+                        help='length of the malformed type segment to time')
+    args = parser.parse_args()
+
+    ids = load_ids(args.ids)
+    print('{} ids'.format(len(ids)))
+    for name, func in (('regex', old_parse), ('parse_id', new_parse)):
+        elapsed = best_of(func, ids, args.repeat)
+        print('   {:<10} {:>8.3f}s {:>8.2f}us/id'.format(name, elapsed, elapsed / len(ids) * 1e6))
+
+    bad_id = 'ocd-division/country:us/' + 'a' * args.adversarial_length + '-'
+    print('malformed id with a {} character type segment'.format(args.adversarial_length))
+    for name, func in (('regex', old_parse), ('parse_id', new_parse)):
+        start = time.perf_counter()
+        try:
+            func(bad_id)
+        except ValueError:
+            pass
+        print('   {:<10} {:>8.3f}s'.format(name, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of SLDProcessor.clean_district, which applies the name
+replacements through replacements.ReplacementTable, against the sequential
+str.replace loop census_places.py used before it.  Every name is also
+checked to clean to the same district both ways.
+
+    ./scripts/bench_replacements.py
+
+The names are rebuilt from the committed us_sldu.csv and us_sldl.csv, which
+hold each gazetteer NAME behind the state name.
+"""
+import os
+import re
+import csv
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'country-us'))
+import census_places  # noqa: E402
+
+PR_NUMERALS = (('VIII', '8'), ('VII', '7'), ('VI', '6'), ('IV', '4'), ('V', '5'), ('III', '3'), ('II', '2'), ('I', '1'))
+
+
+def old_clean_district(usps, name):
+    district = name
+    for k, v in census_places.SLDProcessor.replacements:
+        district = district.replace(k, v)
+    if usps == 'PR':
+        for k, v in PR_NUMERALS:
+            district = district.replace(k, v)
+    elif usps == 'AK':
+        district = re.sub(r'(\d+)(.*)', r'\1', district)
+    elif usps == 'NH':
+        district = re.sub(r'(\d+) (\w*) County', r'\2 \1', district)
+    return district.strip().lstrip('0')
+
+
+def load_names(pattern):
+    """ return (usps, gazetteer NAME) for every row of the committed SLD files """
+    names = []
+    for district_type in ('sldu', 'sldl'):
+        filename = pattern.format(district_type)
+        with open(filename, encoding='UTF-8') as fh:
+            for row in csv.DictReader(fh):
+                usps = row['id'].split('/')[2].split(':')[1].upper()
+                state = census_places.us.states.lookup(usps)
+                name = row['name'][len(str(state)) + 1:] if state else row['name'].split(' ', 1)[1]
+                names.append((usps, name.replace('district', 'District')))
+    return names
+
+
+def clear_caches():
+    for table in (census_places.SLDProcessor.replacement_table, census_places.SLDProcessor.pr_numerals):
+        table.apply.cache_clear()
+
+
+def best_of(func, names, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        for usps, name in names:
+            func(usps, name)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark SLD district name cleaning')
+    parser.add_argument('--names', default='identifiers/country-us/census_autogenerated/us_{}.csv',
+                        help='compiled SLD files to rebuild gazetteer names from, {} is sldu or sldl')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    names = load_names(args.names)
+    for usps, name in names:
+        old = old_clean_district(usps, name)
+        new = census_places.SLDProcessor.clean_district(usps, name)
+        if old != new:
+            sys.exit('mismatch for {} {!r}: {!r} != {!r}'.format(usps, name, old, new))
+    print('{} names ({} distinct) clean identically'.format(len(names), len(set(name for _, name in names))))
+
+    for label, func in (('str.replace', old_clean_district), ('table', census_places.SLDProcessor.clean_district)):
+        elapsed = best_of(func, names, args.repeat)
+        print('   {:<12} {:>8.3f}s {:>8.2f}us/name'.format(label, elapsed, elapsed / len(names) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
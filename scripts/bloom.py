@@ -0,0 +1,123 @@
+"""
+Memory-mapped Bloom filters of division ids.
+
+A Bloom filter answers "is this id possibly in the set?" from a few bits per
+id: a miss means the id is definitely absent, a hit means it is present or,
+with probability about 0.6185 ** bits_per_key (under 1% at the default 10
+bits), a false positive that an exact lookup has to rule out.  The file is
+used in place through mmap, so opening one costs no parsing.  The layout,
+all little-endian, is:
+
+    magic            8 bytes, b'OCDBLM\\x00\\x01'
+    count            u64, number of keys added
+    bits             u64, size of the bit array
+    hashes           u64, probes per key
+    bit array        bits / 8 bytes, bit i is byte i >> 3, mask 1 << (i & 7)
+
+Probe i of a key is (h1 + i * h2) % bits, where h1 and h2 are the two
+little-endian u64 halves of the key's 16-byte BLAKE2b digest.
+
+IdMembership pairs a filter with the id table of the same ids (see
+idtable.py) for exact answers that only touch the table on filter hits.
+"""
+import os
+import math
+import mmap
+import struct
+import hashlib
+
+import idtable
+
+MAGIC = b'OCDBLM\x00\x01'
+_HEADER = struct.Struct('<8sQQQ')
+_DIGEST = struct.Struct('<QQ')
+
+
+def _hashes(key):
+    return _DIGEST.unpack(hashlib.blake2b(key.encode('UTF-8'), digest_size=16).digest())
+
+
+def write_bloom(path, keys, bits_per_key=10):
+    """
+    write a Bloom filter of a collection of keys to path
+
+    The file is written next to path and moved into place once complete.
+    """
+    keys = list(keys)
+    bits = max(64, len(keys) * bits_per_key)
+    bits += -bits % 8
+    hashes = max(1, int(round(bits / max(len(keys), 1) * math.log(2))))
+    array = bytearray(bits // 8)
+    for key in keys:
+        h1, h2 = _hashes(key)
+        for i in range(hashes):
+            bit = (h1 + i * h2) % bits
+            array[bit >> 3] |= 1 << (bit & 7)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(_HEADER.pack(MAGIC, len(keys), bits, hashes))
+        out.write(array)
+    os.replace(tmp_path, path)
+
+
+class BloomFilter(object):
+    """ read-only, memory-mapped view of a file written by write_bloom """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, self._bits, self._hashes = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError('{} is not a Bloom filter'.format(path))
+
+    def __len__(self):
+        return self._count
+
+    def might_contain(self, key):
+        """ return False if key is definitely absent, True if it may be present """
+        mm = self._mm
+        bits = self._bits
+        h1, h2 = _hashes(key)
+        offset = _HEADER.size
+        for i in range(self._hashes):
+            bit = (h1 + i * h2) % bits
+            if not mm[offset + (bit >> 3)] & (1 << (bit & 7)):
+                return False
+        return True
+
+    __contains__ = might_contain
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class IdMembership(object):
+    """ exact id membership from a Bloom filter backed by an id table of the same ids """
+
+    def __init__(self, bloom_path, table_path):
+        self.bloom = BloomFilter(bloom_path)
+        self.table = idtable.IdTable(table_path)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, key):
+        return self.bloom.might_contain(key) and self.table.exists(key)
+
+    def close(self):
+        self.bloom.close()
+        self.table.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,87 @@
+"""
+Alias canonicalization index.
+
+Divisions listed under more than one id carry a sameAs pointing at the
+canonical one.  write_canonical_index resolves every sameAs to the end of its
+chain and stores one row per id in an id table (see idtable.py): the
+canonical id for aliases, and an empty value for ids that are canonical
+already, which keeps the file close to the size of the id list.  Resolving
+any id is then a single lookup:
+
+    with CanonicalIndex('identifiers/country-us.canonical.idtable') as index:
+        index.canonicalize('ocd-division/country:us/state:ak/place:juneau')
+        # 'ocd-division/country:us/state:ak/borough:juneau'
+        for canonical in index.canonicalize_many(ids):
+            ...
+"""
+import idtable
+
+
+def canonical_map(same_as):
+    """
+    resolve {id: sameAs id} to {id: canonical id}
+
+    Each chain is followed to an id without a sameAs and every id along it
+    is pointed straight at that end (union-find with full path
+    compression), so each id is walked once however the chains overlap.
+    Raises ValueError naming the ids if the sameAs links form a cycle.
+    """
+    canonical = {}
+    for start in same_as:
+        path = []
+        on_path = set()
+        id_ = start
+        while id_ in same_as and id_ not in canonical:
+            if id_ in on_path:
+                cycle = path[path.index(id_):] + [id_]
+                raise ValueError('sameAs cycle: ' + ' -> '.join(cycle))
+            on_path.add(id_)
+            path.append(id_)
+            id_ = same_as[id_]
+        root = canonical.get(id_, id_)
+        for alias in path:
+            canonical[alias] = root
+    return canonical
+
+
+def write_canonical_index(result, path):
+    """ write the canonicalization index for a CompileResult to path """
+    rows = list(result.records.sorted_rows(['id', 'sameAs']))
+    canonical = canonical_map({id_: same_as for id_, same_as in rows if same_as})
+    idtable.write_idtable(path, ((id_, canonical.get(id_, '')) for id_, _ in rows))
+
+
+class CanonicalIndex(object):
+    """ canonical id lookups against a file written by write_canonical_index """
+
+    def __init__(self, path):
+        self.table = idtable.IdTable(path)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, id_):
+        return id_ in self.table
+
+    def canonicalize(self, id_):
+        """ return the canonical id for id_, or None if id_ isn't a known id """
+        canonical = self.table.get(id_)
+        if canonical is None:
+            return None
+        return canonical or id_
+
+    def canonicalize_many(self, ids):
+        """ yield canonicalize(id_) for each of an iterable of ids, lazily """
+        get = self.table.get
+        for id_ in ids:
+            canonical = get(id_)
+            yield None if canonical is None else canonical or id_
+
+    def close(self):
+        self.table.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
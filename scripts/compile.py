@@ -3,12 +3,35 @@ import re
 import os
 import sys
 import csv
+import io
 import glob
+import json
+import time
+import array
+import pickle
+import cProfile
+import hashlib
 import fnmatch
 import argparse
 import datetime
 import warnings
+import traceback
+import functools
+import contextlib
 import collections
+import collections.abc
+import concurrent.futures
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+import bloom
+import idtable
+import divisions_db
+import canonical_index
+from division_id import parse_id
 
 
 # Explicitly disallow python 2.x
@@ -17,11 +40,6 @@ if sys.version_info < (3, 0):
     sys.exit(1)
 
 
-def validate_id(id_):
-    id_regex = re.compile(r'^ocd-division/(country|region):[a-z]{2}(/[^\W\d]+[-]?[^\W\d]+:[\w.~-]+)*$', re.U)
-    if not (id_regex.match(id_) and id_.lower() == id_):
-        raise ValueError('invalid id: ' + id_)
-
 def validate_date(date_):
     formats = ['%Y-%m-%d', '%Y-%m', '%Y']
     for format in formats:
@@ -34,35 +52,353 @@ def validate_date(date_):
         raise ValueError('invalid date: ' + date_)
 
 
+class CompileError(Exception):
+    """ raised when a source file cannot be read at all """
+
+
+# a single data problem found while compiling; filename and id are None
+# when the problem isn't tied to one source file or division
+ValidationError = collections.namedtuple('ValidationError', 'kind message filename id')
+
+
+class RecordStore(collections.abc.Mapping):
+    """
+    column-oriented storage for merged division records
+
+    Rather than one dict per division, each field is a list indexed by row
+    number (None where unset), field names are interned once, and source
+    files are stored as indices into a shared filename list.  Indexing the
+    store by id still returns a {field: value} dict, built on demand.
+    """
+
+    def __init__(self):
+        self.fields = []
+        self.filenames = []
+        self.records_with = collections.Counter()
+        self._field_index = {}
+        self._filename_index = {}
+        self._columns = []
+        self._ids = []
+        self._rows = {}
+        # first source of each row; the rare rows with more live in _more_sources
+        self._first_source = array.array('l')
+        self._more_sources = collections.defaultdict(list)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __contains__(self, id_):
+        return id_ in self._rows
+
+    def __getitem__(self, id_):
+        row = self._rows[id_]
+        record = {}
+        for field, column in zip(self.fields, self._columns):
+            if row < len(column) and column[row] is not None:
+                record[field] = column[row]
+        return record
+
+    def _column(self, field):
+        index = self._field_index.get(field)
+        if index is None:
+            index = self._field_index[field] = len(self.fields)
+            self.fields.append(sys.intern(field))
+            self._columns.append([])
+        return self._columns[index]
+
+    def value(self, id_, field):
+        """ return a single field of a record, or None if it isn't set """
+        index = self._field_index.get(field)
+        if index is None:
+            return None
+        row = self._rows[id_]
+        column = self._columns[index]
+        return column[row] if row < len(column) else None
+
+    def set_value(self, id_, field, val):
+        """ set a single field of an existing record """
+        column = self._column(field)
+        row = self._rows[id_]
+        if row >= len(column):
+            column.extend([None] * (row + 1 - len(column)))
+        if column[row] is None:
+            self.records_with[field] += 1
+        column[row] = val
+
+    def add(self, row, filename):
+        """
+        merge a source row into its record
+
+        Blank values are skipped and fields that are already set are left
+        alone.  Returns a list of (field, existing, new) for values that
+        disagree with what was already set.
+        """
+        id_ = row['id']
+        row_no = self._rows.get(id_)
+        if row_no is None:
+            row_no = self._rows[id_] = len(self._ids)
+            self._ids.append(id_)
+            self._first_source.append(self._source_index(filename))
+        else:
+            self._more_sources[row_no].append(self._source_index(filename))
+
+        conflicts = []
+        for key, val in row.items():
+            # skip if value is blank
+            if not val:
+                continue
+            column = self._column(key)
+            if row_no >= len(column):
+                column.extend([None] * (row_no + 1 - len(column)))
+            existing = column[row_no]
+            if existing is None:
+                column[row_no] = val
+                self.records_with[key] += 1
+            elif existing != val:
+                conflicts.append((key, existing, val))
+        return conflicts
+
+    def add_rows(self, fieldnames, rows, filename):
+        """
+        merge rows given as tuples of values in fieldnames order
+
+        Each row is merged as add would merge it, but the columns are looked
+        up once per call rather than once per value.  Returns a list of
+        (id, field, existing, new, earlier sources) for values that disagree
+        with what was already set.
+        """
+        source = self._source_index(filename)
+        id_column = fieldnames.index('id')
+        columns = [self._column(field) for field in fieldnames]
+        counts = [0] * len(fieldnames)
+        ids = self._ids
+        row_numbers = self._rows
+        conflicts = []
+        for values in rows:
+            id_ = values[id_column]
+            row_no = row_numbers.get(id_)
+            if row_no is None:
+                row_no = row_numbers[id_] = len(ids)
+                ids.append(id_)
+                self._first_source.append(source)
+            else:
+                self._more_sources[row_no].append(source)
+
+            for i, val in enumerate(values):
+                # skip if value is blank
+                if not val:
+                    continue
+                column = columns[i]
+                if row_no >= len(column):
+                    column.extend([None] * (row_no + 1 - len(column)))
+                existing = column[row_no]
+                if existing is None:
+                    column[row_no] = val
+                    counts[i] += 1
+                elif existing != val:
+                    conflicts.append((id_, fieldnames[i], existing, val, self.sources(id_)[:-1]))
+        for field, count in zip(fieldnames, counts):
+            if count:
+                self.records_with[field] += count
+        return conflicts
+
+    def _source_index(self, filename):
+        index = self._filename_index.get(filename)
+        if index is None:
+            index = self._filename_index[filename] = len(self.filenames)
+            self.filenames.append(filename)
+        return index
+
+    def sources(self, id_):
+        """ return the source filenames that contributed to a record """
+        row = self._rows[id_]
+        return [self.filenames[i] for i in [self._first_source[row]] + self._more_sources.get(row, [])]
+
+    def field_values(self, field):
+        """ yield (id, value) for every record with field set """
+        index = self._field_index.get(field)
+        if index is None:
+            return
+        for id_, val in zip(self._ids, self._columns[index]):
+            if val is not None:
+                yield id_, val
+
+    def missing(self, field):
+        """ yield the ids of records without field set """
+        index = self._field_index.get(field)
+        column = self._columns[index] if index is not None else []
+        for row, id_ in enumerate(self._ids):
+            if row >= len(column) or column[row] is None:
+                yield id_
+
+    def sorted_rows(self, field_order):
+        """ yield each record as a list of values in field_order, sorted by id """
+        columns = []
+        for field in field_order:
+            column = self._columns[self._field_index[field]] if field in self._field_index else []
+            columns.append(column + [''] * (len(self._ids) - len(column)))
+        for row in sorted(range(len(self._ids)), key=self._ids.__getitem__):
+            yield [column[row] or '' for column in columns]
+
+
+class CompileResult(object):
+    """
+    the in-memory output of compile_country
+
+    records       -- RecordStore of every division, a Mapping of {id: {field: value}}
+    field_order   -- column order for the compiled CSV
+    types         -- Counter of division types across source rows
+    records_with  -- Counter of how many records have each field
+    errors        -- list of ValidationError, empty when the data is clean
+    unique_fields -- fields besides id that were checked for duplicates
+    """
+
+    def __init__(self, country, records, field_order, types, errors, unique_fields=()):
+        self.country = country
+        self.records = records
+        self.field_order = field_order
+        self.types = types
+        self.records_with = records.records_with
+        self.errors = errors
+        self.unique_fields = list(unique_fields)
+
+    def sorted_rows(self):
+        """ yield each record as a list of values in field_order, sorted by id """
+        return self.records.sorted_rows(self.field_order)
+
+
+def _peak_rss_mb():
+    """ peak resident set size of this process so far, or None if unknown """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class PhaseTimer(object):
+    """
+    accumulates wall-clock and CPU seconds per named phase of a compile
+
+    compile_country and read_source time their phases (parse, validate,
+    merge, same_as, parents, required, unique) when given one:
+
+        timer = PhaseTimer()
+        result = compile_country('ca', timer=timer)
+        with timer.phase('write'):
+            write_csv(result, 'identifiers/country-ca.csv')
+        timer.seconds  # {'parse': 0.21, 'validate': 0.05, ...}
+
+    cpu_seconds is kept the same way, and files maps each source file to
+    its row count and seconds spent reading and merging it.
+
+    The kernel only keeps the process's peak RSS, not a peak per phase, so
+    peak_rss_growth_mb holds how far each phase raised that high-water
+    mark.  A phase that allocates less than an earlier phase freed shows
+    no growth however much it uses; report() also gives the process's
+    peak as peak_rss_mb.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.cpu_seconds = {}
+        self.peak_rss_growth_mb = {}
+        self.files = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        rss_start = _peak_rss_mb()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            self.cpu_seconds[name] = self.cpu_seconds.get(name, 0.0) + time.process_time() - cpu_start
+            if rss_start is not None:
+                growth = _peak_rss_mb() - rss_start
+                self.peak_rss_growth_mb[name] = self.peak_rss_growth_mb.get(name, 0.0) + growth
+
+    def add_file(self, filename, rows, seconds):
+        self.files[filename] = (rows, seconds)
+
+    def report(self, slowest=10):
+        """ return a JSON-serializable dict of the timings """
+        files = [{'filename': filename, 'rows': rows, 'seconds': round(seconds, 6),
+                  'rows_per_second': round(rows / seconds) if seconds else None}
+                 for filename, (rows, seconds) in sorted(self.files.items())]
+        return {
+            'wall_seconds': round(sum(self.seconds.values()), 6),
+            'cpu_seconds': round(sum(self.cpu_seconds.values()), 6),
+            'peak_rss_mb': _peak_rss_mb(),
+            'phases': {name: {'wall_seconds': round(seconds, 6),
+                              'cpu_seconds': round(self.cpu_seconds[name], 6),
+                              'peak_rss_growth_mb': self.peak_rss_growth_mb.get(name)}
+                       for name, seconds in self.seconds.items()},
+            'source_rows': sum(rows for rows, _ in self.files.values()),
+            'files': files,
+            'slowest_files': sorted(files, key=lambda f: f['seconds'], reverse=True)[:slowest],
+        }
+
+
+class _NullTimer(object):
+    """ stands in for a PhaseTimer when a compile isn't being timed """
+
+    def phase(self, name):
+        return contextlib.nullcontext()
+
+    def add_file(self, filename, rows, seconds):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
 def abort(msg):
     """ print in red and exit """
     print('\033[91mERROR:', msg, '\033[0m')
     sys.exit(1)
 
 
-def open_csv(filename):
-    """ return a DictReader iterable regardless of input CSV type """
-    fh = open(filename, encoding='UTF-8')
-    first_row = next(csv.reader(fh))
-    if 'ocd-division/country' in first_row[0]:
-        if len(first_row) == 2:
-            print('processing (legacy mode)', filename)
-            warnings.warn('proceeding in legacy mode, please add column headers to file',
-                          DeprecationWarning)
-            fh.seek(0)
-            return csv.DictReader(fh, ('id', 'name'))
+@contextlib.contextmanager
+def open_csv(filename, verbose=True):
+    """ yield a DictReader iterable regardless of input CSV type, closing the file after """
+    with open(filename, encoding='UTF-8') as fh:
+        first_row = next(csv.reader(fh))
+        if 'ocd-division/country' in first_row[0]:
+            if len(first_row) == 2:
+                if verbose:
+                    print('processing (legacy mode)', filename)
+                warnings.warn('proceeding in legacy mode, please add column headers to file',
+                              DeprecationWarning)
+                fh.seek(0)
+                yield csv.DictReader(fh, ('id', 'name'))
+            else:
+                raise CompileError('No column headers detected in ' + filename)
         else:
-            abort('No column headers detected in ' + filename)
-    else:
-        print('processing', filename)
-        fh.seek(0)
-        return csv.DictReader(fh)
+            if verbose:
+                print('processing', filename)
+            fh.seek(0)
+            yield csv.DictReader(fh)
 
+# each raises ValueError for an invalid value; validate_row keeps what they return
 FIELD_VALIDATORS = {
-    'id': validate_id,
+    'id': parse_id,
     'validThrough': validate_date,
 }
 
+# bump when validation or parsing changes to invalidate cached sources
+CACHE_VERSION = 4
+
+# the validated rows of one source file as tuples of values in fieldnames
+# order, with the Counter of their division types and the set of their parent
+# ids, taken from the ids parsed during validation so the merge needn't parse
+# them again
+Source = collections.namedtuple('Source', 'fieldnames rows types parents errors')
+
 COUNTRY_UNIQUE_FIELDS = {
     'us': ['census_geoid', 'census_geoid_12', 'census_geoid_14'],
     'ca': [
@@ -75,143 +411,226 @@ COUNTRY_UNIQUE_FIELDS = {
     ],
 }
 
-def main():
-    parser = argparse.ArgumentParser(description='combine component CSV files into one')
-    parser.add_argument('country', type=str, default=None, help='country to compile')
-    parser.add_argument('--output_csv', type=str, default=None, help='output location for compiled csv')
-    args = parser.parse_args()
-    country = args.country.lower()
-
-    ids = collections.defaultdict(dict)
-    sources = collections.defaultdict(list)
-    records_with = collections.Counter()
+def list_countries(root=os.curdir):
+    """ return the sorted country codes that have a source directory """
+    _, dirnames, _ = next(os.walk(os.path.join(root, 'identifiers')))
+    countries = []
+    for dirname in dirnames:
+        m = re.match(r'country-(..)$', dirname)
+        if m:
+            countries.append(m.group(1))
+    return sorted(countries)
+
+
+def validate_row(row, filename, parsed=None):
+    """
+    run FIELD_VALIDATORS over a row, returning a list of ValidationErrors
+
+    If parsed is a dict, what each validator returned is stored in it by
+    field, e.g. the DivisionId of the row's id under 'id'.
+    """
+    errors = []
+    for field, validator in FIELD_VALIDATORS.items():
+        val = row.get(field)
+        if val:
+            try:
+                result = validator(val)
+                if parsed is not None:
+                    parsed[field] = result
+            except ValueError as e:
+                errors.append(ValidationError('invalid_field', 'validation error in {}: {}'.format(filename, e),
+                                              filename, row.get('id')))
+    return errors
+
+
+def read_source(filename, cache_dir=None, root=os.curdir, verbose=True, timer=None):
+    """
+    return a Source for a source file
+
+    filename is relative to root.  Rows that fail validation are left out
+    of rows and reported in errors instead.
+
+    If cache_dir is given, validated rows, types and parents are pickled
+    there keyed by the file's path and the sha1 of its contents, so
+    unchanged files are not re-parsed or re-validated on the next run; the
+    cached rows are returned as they were stored, without a per-row step.
+
+    Reading (or loading from the cache) is timed as the parse phase and
+    checking rows as the validate phase of timer, if given.
+    """
+    timer = timer or _NULL_TIMER
+    path = os.path.normpath(os.path.join(root, filename))
+    if cache_dir:
+        with timer.phase('parse'):
+            with open(path, 'rb') as fh:
+                h = hashlib.sha1(fh.read()).hexdigest()
+            cache_key = hashlib.sha1('{}:{}'.format(CACHE_VERSION, filename).encode('UTF-8')).hexdigest()
+            cache_file = os.path.join(cache_dir, cache_key + '.pickle')
+            try:
+                with open(cache_file, 'rb') as fh:
+                    store = pickle.load(fh)
+                if store['hash'] == h:
+                    if verbose:
+                        print('processing (cached)', filename)
+                    return Source(store['fieldnames'], store['rows'], store['types'], store['parents'], [])
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass  # missing or bad .pickle file, pretend it doesn't exist
+
+    with timer.phase('parse'):
+        try:
+            with open_csv(path, verbose) as csvfile:
+                if 'id' not in csvfile.fieldnames:
+                    return Source([], [], collections.Counter(), set(), [ValidationError(
+                        'no_header', '{} does not have id column'.format(filename), filename, None)])
+                fieldnames = list(csvfile.fieldnames)
+                parsed_rows = list(csvfile)
+        except CompileError as e:
+            return Source([], [], collections.Counter(), set(),
+                          [ValidationError('no_header', str(e), filename, None)])
+
+    with timer.phase('validate'):
+        rows = []
+        types = collections.Counter()
+        parents = set()
+        errors = []
+        for row in parsed_rows:
+            if None in row:
+                errors.append(ValidationError('extra_values', 'row with more values than columns in {}: {}'.format(
+                    filename, row.get('id')), filename, row.get('id')))
+                continue
+            if not row['id']:
+                errors.append(ValidationError('missing_id', 'row without an id in {}'.format(filename),
+                                              filename, None))
+                continue
+            parsed = {}
+            row_errors = validate_row(row, filename, parsed)
+            if row_errors:
+                errors.extend(row_errors)
+                continue
+            rows.append(tuple(row[f] for f in fieldnames))
+            types[parsed['id'].type] += 1
+            if parsed['id'].parent:
+                parents.add(parsed['id'].parent)
+
+    if cache_dir and not errors:
+        os.makedirs(cache_dir, exist_ok=True)
+        store = {'hash': h, 'fieldnames': fieldnames, 'rows': rows, 'types': types, 'parents': parents}
+        with open(cache_file + '.tmp', 'wb') as fh:
+            pickle.dump(store, fh, pickle.HIGHEST_PROTOCOL)
+        os.replace(cache_file + '.tmp', cache_file)
+
+    return Source(fieldnames, rows, types, parents, errors)
+
+
+def _merge_rows(ids, source, filename, same_as, errors):
+    """ merge a Source's rows into ids, noting sameAs """
+    # map sameAs
+    if 'sameAs' in source.fieldnames:
+        id_column = source.fieldnames.index('id')
+        same_as_column = source.fieldnames.index('sameAs')
+        for values in source.rows:
+            if values[same_as_column]:
+                same_as[values[id_column]] = values[same_as_column]
+
+    # update records
+    for id_, key, existing, val, other_sources in ids.add_rows(source.fieldnames, source.rows, filename):
+        msg = 'mismatch for attribute {} on {}\n'.format(key, id_)
+        msg += 'was set to {} - got {} from {}\n'.format(existing, val, filename)
+        msg += 'other sources:\n'
+        for other in other_sources:
+            msg += '   ' + other + '\n'
+        errors.append(ValidationError('mismatch', msg, filename, id_))
+
+
+def compile_country(country, root=os.curdir, cache_dir=None, verbose=False, timer=None, unique_fields=None):
+    """
+    compile the sources for a single country into a CompileResult
+
+    Data problems don't stop the compile; they are collected in the
+    result's errors, and the caller decides whether to write the output.
+    Pass a PhaseTimer as timer to time each phase.  unique_fields are the
+    fields besides id whose values must be unique, by default the
+    country's COUNTRY_UNIQUE_FIELDS.
+    """
+    timer = timer or _NULL_TIMER
+    country = country.lower()
+    if unique_fields is None:
+        unique_fields = COUNTRY_UNIQUE_FIELDS.get(country, [])
+    ids = RecordStore()
     types = collections.Counter()
     same_as = {}
     all_keys = []
     missing_parents = set()
+    errors = []
 
-    path = 'identifiers/country-{}/'.format(country)
-    filenames = [os.path.join(dirpath, f)
-                 for dirpath, dirnames, files in os.walk(path)
-                 for f in fnmatch.filter(files, '*.csv')]
+    path = os.path.join(root, 'identifiers', 'country-{}'.format(country))
+    filenames = sorted(os.path.relpath(os.path.join(dirpath, f), root)
+                       for dirpath, dirnames, files in os.walk(path)
+                       for f in fnmatch.filter(files, '*.csv'))
 
     for filename in filenames:
-        csvfile = open_csv(filename)
-        if 'id' not in csvfile.fieldnames:
-            abort('{} does not have id column')
-        for field in csvfile.fieldnames:
+        file_start = time.perf_counter()
+        source = read_source(filename, cache_dir, root, verbose, timer)
+        errors.extend(source.errors)
+        for field in source.fieldnames:
             if field not in all_keys:
                 all_keys.append(field)
 
-        for row in csvfile:
-
-            for field, validator in FIELD_VALIDATORS.items():
-                val = row.get(field)
-                if val:
-                    try:
-                        validator(val)
-                    except ValueError as e:
-                        abort('validation error in {}: {}'.format(filename, e))
-
-            # check parents
-            id_ = row['id']
-            parent, endpiece = id_.rsplit('/', 1)
-            if parent != 'ocd-division' and parent not in ids:
-                missing_parents.add(parent)
-
-            # count types
-            type_ = endpiece.split(':')[0]
-            types[type_] += 1
-
-            # map sameAs
-            if row.get('sameAs'):
-                same_as[id_] = row['sameAs']
-
-            # update record
-            id_record = ids[id_]
-            for key, val in row.items():
-                # skip if value is blank
-                if not val:
-                    continue
-                elif key not in id_record:
-                    id_record[key] = val
-                    records_with[key] += 1
-                elif val and id_record[key] != val:
-                    msg = 'mismatch for attribute {} on {}\n'.format(key, id_)
-                    msg += 'was set to {} - got {} from {}\n'.format(id_record[key], val, filename)
-                    msg += 'other sources:\n'
-                    for source in sources[id_]:
-                        msg += '   ' + source + '\n'
-                    abort(msg)
-            # add source
-            sources[id_].append(filename)
+        with timer.phase('merge'):
+            # parents are checked against every id once all files are merged
+            types.update(source.types)
+            missing_parents.update(source.parents)
+            _merge_rows(ids, source, filename, same_as, errors)
+        timer.add_file(filename, len(source.rows), time.perf_counter() - file_start)
 
     # process sameAs
-    for dup_id, orig_id in same_as.items():
-        if orig_id not in ids:
-            abort('{0} is sameAs {1} which does not exist'.format(dup_id, orig_id))
-
-        dup = ids[dup_id]
-        orig = ids[orig_id]
-        if orig.get('sameAs'):
-            msg = 'sameAs chain: {0} -> {1} -> {2}'.format(
-                dup_id, orig_id, orig['sameAs'])
-            abort(msg)
-
-        # copy name if it doesn't exist
-        if not dup.get('name'):
-            dup['name'] = orig['name']
-            records_with['name'] += 1
+    with timer.phase('same_as'):
+        for dup_id, orig_id in same_as.items():
+            if orig_id not in ids:
+                errors.append(ValidationError('unknown_same_as',
+                                              '{0} is sameAs {1} which does not exist'.format(dup_id, orig_id),
+                                              None, dup_id))
+                continue
+
+            if ids.value(orig_id, 'sameAs'):
+                msg = 'sameAs chain: {0} -> {1} -> {2}'.format(
+                    dup_id, orig_id, ids.value(orig_id, 'sameAs'))
+                errors.append(ValidationError('same_as_chain', msg, None, dup_id))
+                continue
+
+            # copy name if it doesn't exist
+            if not ids.value(dup_id, 'name') and ids.value(orig_id, 'name'):
+                ids.set_value(dup_id, 'name', ids.value(orig_id, 'name'))
 
     # data quality: parents
-    missing_parents -= set(ids.keys())
-    # Adding exception for the EU as the parent id is defined within the eu directory
-    if 'ocd-division/region:eu' in missing_parents: missing_parents.remove('ocd-division/region:eu')
-    if missing_parents:
-        msg = '{} unknown parents\n'.format(len(missing_parents))
+    with timer.phase('parents'):
+        missing_parents = {parent for parent in missing_parents if parent not in ids}
+        # Adding exception for the EU as the parent id is defined within the eu directory
+        if 'ocd-division/region:eu' in missing_parents: missing_parents.remove('ocd-division/region:eu')
         for parent in sorted(missing_parents):
-            msg += '   ' + parent
-        abort(msg)
+            errors.append(ValidationError('unknown_parent', 'unknown parent ' + parent, None, parent))
 
     # data quality: required fields
-    for field in ('name',):
-        count_diff = records_with['id'] - records_with[field]
-        if count_diff:
-            msg = '{} records missing required field "{}"\n'.format(count_diff, field)
-            for id_, row in ids.items():
-                if field not in row:
-                    msg += '   {} from {}\n'.format(id_, ', '.join(sources[id_]))
-            abort(msg)
+    with timer.phase('required'):
+        for field in ('name',):
+            for id_ in ids.missing(field):
+                msg = '{} missing required field "{}" from {}'.format(id_, field, ', '.join(ids.sources(id_)))
+                errors.append(ValidationError('missing_field', msg, None, id_))
 
     # data quality: assert uniqueness of certain fields, ignoring missing values
-    duplicate_values_found_in = {}
-    unique_fields = ['id'] + COUNTRY_UNIQUE_FIELDS.get(country, [])
-    for field in unique_fields:
-        seen_values = set()
-        duplicate_values = set()
-
-        for row in ids.values():
-            value = row.get(field, '')
-            if value and value in seen_values:
-                duplicate_values.add(value)
-            seen_values.add(value)
-
-        if duplicate_values:
-            duplicate_values_found_in[field] = duplicate_values
-    if duplicate_values_found_in:
-        msg = "Duplicate values found in fields that should be unique!\n{}".format(duplicate_values_found_in)
-        abort(msg)
-
-
-    # print some statistics
-    print('types')
-    for type_, count in types.most_common():
-        print('   {:<25} {:>10}'.format(type_, count))
+    with timer.phase('unique'):
+        for field in ['id'] + list(unique_fields):
+            seen_values = set()
+            duplicate_values = set()
 
-    print('fields')
-    for key, count in records_with.most_common():
-        print('   {:<20} {:>10} {:>10.0%}'.format(key, count, count/records_with['id']))
+            for _, value in ids.field_values(field):
+                if value in seen_values:
+                    duplicate_values.add(value)
+                seen_values.add(value)
 
+            for value in sorted(duplicate_values):
+                msg = 'duplicate value {} in field {} that should be unique'.format(value, field)
+                errors.append(ValidationError('duplicate_value', msg, None, None))
 
     # set consistent field order [id, name, sameAs, validThrough] + sorted(the_rest)
     field_order = ['id', 'name', 'sameAs', 'sameAsNote', 'validThrough']
@@ -222,14 +641,305 @@ def main():
             field_order.remove(k)
     field_order += sorted(all_keys)
 
-    # write output file
-    output_file = args.output_csv or 'identifiers/country-{}.csv'.format(country)
-    print('writing', output_file)
+    return CompileResult(country, ids, field_order, types, errors, unique_fields)
+
+
+def print_statistics(result):
+    """ print type and field counts for a compiled country """
+    print('types')
+    for type_, count in result.types.most_common():
+        print('   {:<25} {:>10}'.format(type_, count))
+
+    print('fields')
+    for key, count in result.records_with.most_common():
+        print('   {:<20} {:>10} {:>10.0%}'.format(key, count, count/result.records_with['id']))
+
+
+def write_csv(result, output_file):
+    """ write a compiled country to a CSV file """
     with open(output_file, 'w', encoding='UTF-8') as out:
-        out = csv.DictWriter(out, fieldnames=field_order)
-        out.writeheader()
-        for id_, row in sorted(ids.items()):
-            out.writerow(row)
+        out = csv.writer(out)
+        out.writerow(result.field_order)
+        out.writerows(result.sorted_rows())
+
+
+# result of comparing a compile against a committed CSV: whether they match,
+# how many data rows matched, the id at the first difference (None if they
+# match) and the sha1 of everything that matched, with \n line endings
+CheckResult = collections.namedtuple('CheckResult', 'matches rows id digest')
+
+
+class _LastLine(object):
+    """ file-like object that keeps only the last line csv.writer wrote """
+
+    def write(self, line):
+        self.line = line
+
+
+def check_csv(result, path):
+    """
+    compare what write_csv would write for result against the file at path
+
+    Rows are rendered and compared one at a time against the same number
+    of characters read from the file, so neither side is ever held in
+    memory, and the comparison stops at the first difference.  Like the
+    compile test, it doesn't distinguish \r\n from \n line endings.
+    """
+    digest = hashlib.sha1()
+    last = _LastLine()
+    writer = csv.writer(last, lineterminator='\n')
+    rows = 0
+    try:
+        fh = open(path, encoding='UTF-8')
+    except FileNotFoundError:
+        return CheckResult(False, 0, None, digest.hexdigest())
+    with fh:
+        writer.writerow(result.field_order)
+        if fh.read(len(last.line)) != last.line:
+            return CheckResult(False, 0, None, digest.hexdigest())
+        digest.update(last.line.encode('UTF-8'))
+        for row in result.sorted_rows():
+            writer.writerow(row)
+            if fh.read(len(last.line)) != last.line:
+                return CheckResult(False, rows, row[0], digest.hexdigest())
+            digest.update(last.line.encode('UTF-8'))
+            rows += 1
+        extra = fh.readline()
+        if extra:
+            return CheckResult(False, rows, extra.split(',', 1)[0], digest.hexdigest())
+    return CheckResult(True, rows, None, digest.hexdigest())
+
+
+def sorted_lines_match(result, path):
+    """
+    return True if the file at path holds the same header and the same
+    rows as write_csv would write for result, in any order
+
+    Some committed CSVs were written by an older compiler whose sort order
+    differs, which the compile test accepts too.  Both sides are read into
+    memory, so this is only the fallback for when check_csv fails.
+    """
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(result.field_order)
+    writer.writerows(result.sorted_rows())
+    try:
+        with open(path, encoding='UTF-8') as fh:
+            committed = fh.read().splitlines()
+    except FileNotFoundError:
+        return False
+    compiled = out.getvalue().splitlines()
+    return committed[:1] == compiled[:1] and sorted(committed[1:]) == sorted(compiled[1:])
+
+
+def check_errors(result, path, check=None):
+    """
+    return check_csv's verdict on path as a list of ValidationErrors,
+    accepting a file that differs only in row order
+    """
+    check = check or check_csv(result, path)
+    if check.matches or sorted_lines_match(result, path):
+        return []
+    if check.id is None:
+        msg = '{} is missing or has a different header'.format(path)
+    else:
+        msg = '{} differs from the compiled output after {} rows, at {}'.format(path, check.rows, check.id)
+    return [ValidationError('check_mismatch', msg, path, check.id)]
+
+
+def reverse_index_path(output_file, field):
+    """ where write_outputs puts the code -> id table for a unique field """
+    return '{}.{}.idtable'.format(os.path.splitext(output_file)[0], field)
+
+
+def write_reverse_indexes(result, output_file):
+    """
+    write a code -> id idtable for each of the result's unique fields
+
+    compile_country has already rejected duplicate codes, so every code
+    maps to exactly one id.  Returns the paths written.
+    """
+    paths = []
+    for field in result.unique_fields:
+        if field not in result.field_order:
+            continue
+        path = reverse_index_path(output_file, field)
+        values = result.records.field_values(field)
+        idtable.write_idtable(path, sorted((value, id_) for id_, value in values))
+        paths.append(path)
+    return paths
+
+
+def write_outputs(result, output_file, sqlite=False, id_table=False, reverse_index=False, canonical=False,
+                  bloom_filter=False):
+    """ write the compiled CSV and any requested artifacts alongside it """
+    write_csv(result, output_file)
+    base = os.path.splitext(output_file)[0]
+    if sqlite:
+        divisions_db.write_db(result, base + '.sqlite', result.unique_fields)
+    if id_table or bloom_filter:
+        idtable.write_idtable(base + '.idtable', result.records.sorted_rows(['id', 'name']))
+    if reverse_index:
+        write_reverse_indexes(result, output_file)
+    if canonical:
+        canonical_index.write_canonical_index(result, base + '.canonical.idtable')
+    if bloom_filter:
+        # the id table above is the exact fallback for filter hits; the filter
+        # goes last, as normalize_ids skips one older than the canonical index
+        bloom.write_bloom(base + '.bloom', (id_ for id_, in result.records.sorted_rows(['id'])))
+
+
+def format_errors(errors):
+    """ join ValidationErrors into a single message """
+    return '{} errors\n'.format(len(errors)) + '\n'.join(error.message for error in errors)
+
+
+def _unexpected_error(country, message):
+    return ValidationError('unexpected_error', '{} failed with an unexpected error:\n{}'.format(country, message),
+                           None, None)
+
+
+def _compile_worker(country, output_csv, cache_dir=None, check=False, **outputs):
+    """
+    compile and write (or, with check, compare) one country,
+    returning (country, seconds, errors)
+
+    An exception is reported as an error for this country rather than
+    raised, so one bad country doesn't lose the others' results.
+    """
+    start = time.perf_counter()
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            result = compile_country(country, cache_dir=cache_dir)
+        output_csv = output_csv or 'identifiers/country-{}.csv'.format(country)
+        if result.errors:
+            return country, time.perf_counter() - start, result.errors
+        if check:
+            return country, time.perf_counter() - start, check_errors(result, output_csv)
+        write_outputs(result, output_csv, **outputs)
+    except Exception:
+        return country, time.perf_counter() - start, [_unexpected_error(country, traceback.format_exc())]
+    return country, time.perf_counter() - start, []
+
+
+def compile_all(countries, output_dir=None, jobs=None, cache_dir=None, check=False, **outputs):
+    """
+    compile many countries on a process pool
+
+    With check, compiled CSVs are compared against the existing files (see
+    check_csv) rather than written.  Extra keyword arguments are passed to
+    write_outputs.  Returns a list of
+    (country, seconds, errors) tuples in the order of ``countries``; errors
+    is empty for countries that compiled cleanly.
+    """
+    output_csvs = [os.path.join(output_dir, 'country-{}.csv'.format(country)) if output_dir else None
+                   for country in countries]
+    worker = functools.partial(_compile_worker, cache_dir=cache_dir, check=check, **outputs)
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(worker, country, output_csv) for country, output_csv in zip(countries, output_csvs)]
+        for country, future in zip(countries, futures):
+            # the worker reports its own exceptions; this catches a worker that died
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append((country, 0.0, [_unexpected_error(country, repr(e))]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='combine component CSV files into one')
+    parser.add_argument('country', type=str, nargs='*', help='country (or countries) to compile')
+    parser.add_argument('--all', action='store_true', help='compile every country in identifiers/')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes for multi-country compiles (default: one per CPU)')
+    parser.add_argument('--output_csv', type=str, default=None, help='output location for compiled csv')
+    parser.add_argument('--output_dir', type=str, default=None,
+                        help='output directory for compiled csvs in multi-country mode')
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help='directory for cached parsed sources, e.g. cache/compile')
+    parser.add_argument('--check', action='store_true',
+                        help="compare against the existing compiled csv instead of writing; exit 1 if they differ")
+    parser.add_argument('--profile', type=str, default=None, metavar='REPORT_JSON',
+                        help='write per-phase and per-file timings of a single-country compile to this file')
+    parser.add_argument('--pstats', type=str, default=None,
+                        help='with --profile, also run under cProfile and dump the stats here')
+    parser.add_argument('--sqlite', action='store_true',
+                        help='also write an indexed SQLite database next to each compiled csv')
+    parser.add_argument('--idtable', action='store_true',
+                        help='also write a memory-mappable id -> name lookup table next to each compiled csv')
+    parser.add_argument('--reverse_index', action='store_true',
+                        help="also write a code -> id lookup table for each of the country's unique fields")
+    parser.add_argument('--canonical_index', action='store_true',
+                        help='also write an id -> canonical id table resolving every sameAs alias')
+    parser.add_argument('--bloom', action='store_true',
+                        help='also write a Bloom filter of the ids, with the --idtable file as its exact fallback')
+    args = parser.parse_args()
+    outputs = {'sqlite': args.sqlite, 'id_table': args.idtable, 'reverse_index': args.reverse_index,
+               'canonical': args.canonical_index, 'bloom_filter': args.bloom}
+    countries = list_countries() if args.all else [c.lower() for c in args.country]
+
+    if not countries:
+        parser.error('specify a country or --all')
+    if args.pstats and not args.profile:
+        parser.error('--pstats requires --profile')
+    if len(countries) == 1 and not args.all:
+        country = countries[0]
+        timer = PhaseTimer() if args.profile else None
+        profiler = None
+        if args.pstats:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        result = compile_country(country, cache_dir=args.cache_dir, verbose=True, timer=timer)
+        if result.errors:
+            abort(format_errors(result.errors))
+        print_statistics(result)
+
+        output_file = args.output_csv or os.path.join(args.output_dir or 'identifiers',
+                                                      'country-{}.csv'.format(country))
+        errors = []
+        if args.check:
+            with (timer or _NULL_TIMER).phase('check'):
+                check = check_csv(result, output_file)
+                errors = check_errors(result, output_file, check)
+            print('checked {} rows of {}, sha1 {}'.format(check.rows, output_file, check.digest))
+            if not errors and not check.matches:
+                print('{} matches, with its rows in a different order'.format(output_file))
+        else:
+            print('writing', output_file)
+            with (timer or _NULL_TIMER).phase('write'):
+                write_outputs(result, output_file, **outputs)
+
+        # the profile covers --check runs too, including ones that fail
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.pstats)
+        if timer:
+            report = dict(timer.report(), country=country, divisions=len(result.records))
+            with open(args.profile, 'w', encoding='UTF-8') as out:
+                json.dump(report, out, indent=2)
+            print('wrote profile to', args.profile)
+        if errors:
+            abort(format_errors(errors))
+        return
+    if args.output_csv:
+        parser.error('--output_csv only applies when compiling a single country')
+    if args.profile:
+        parser.error('--profile only applies when compiling a single country')
+
+    results = compile_all(countries, args.output_dir, args.jobs, args.cache_dir, args.check, **outputs)
+
+    print('{:<10} {:>10}  {}'.format('country', 'seconds', 'status'))
+    for country, seconds, errors in results:
+        print('   {:<7} {:>10.2f}  {}'.format(country, seconds, '{} errors'.format(len(errors)) if errors else 'ok'))
+    print('   {:<7} {:>10.2f}  {} countries'.format('total', sum(r[1] for r in results), len(results)))
+
+    failed = [(country, errors) for country, _, errors in results if errors]
+    if failed:
+        abort('{} of {} countries failed\n'.format(len(failed), len(results)) +
+              '\n'.join('{}: {}'.format(country, format_errors(errors)) for country, errors in failed))
+
 
 if __name__ == '__main__':
     main()
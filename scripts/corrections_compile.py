@@ -5,7 +5,8 @@ import csv
 import fnmatch
 import argparse
 import collections
-from compile import validate_id
+import bloom
+from division_id import validate_id
 from compile import abort
 
 
@@ -22,6 +23,25 @@ def open_csv(filename):
     fh.seek(0)
     return csv.DictReader(fh)
 
+def load_canonical_ids(repo_file):
+    """
+    return a container of every id in a compiled country file
+
+    Uses the Bloom filter and id table written by compile.py --bloom when
+    they are at least as new as the CSV, so most lookups of unknown ids
+    never leave the filter; otherwise reads the CSV into a set.
+    """
+    base = os.path.splitext(repo_file)[0]
+    bloom_file, table_file = base + '.bloom', base + '.idtable'
+    if all(os.path.exists(f) and os.path.getmtime(f) >= os.path.getmtime(repo_file)
+           for f in (bloom_file, table_file)):
+        print('reading id filter', bloom_file)
+        return bloom.IdMembership(bloom_file, table_file)
+
+    repocsv = open_csv(repo_file)
+    print('reading country file', repo_file)
+    return {row['id'] for row in repocsv}
+
 def main():
     parser = argparse.ArgumentParser(description='combine correction CSV files into one')
     parser.add_argument('country', type=str, default=None, help='country to compile')
@@ -29,7 +49,6 @@ def main():
     country = args.country.lower()
 
     corrections = collections.defaultdict(dict)
-    canonical_ids = set()
     required_fields = ['incorrectId', 'id', 'note']
 
     repo_file = 'identifiers/country-{}.csv'.format(country)
@@ -37,10 +56,7 @@ def main():
     # Reads in all ocd division ids from compiles country file
     #  including those that are aliased to others,
     #  thus allowing corrected ids to point to aliased ocd division ids
-    repocsv = open_csv(repo_file)
-    print('reading country file', repo_file)
-    for row in repocsv:
-        canonical_ids.add(row['id'])
+    canonical_ids = load_canonical_ids(repo_file)
 
     path = 'corrections/country-{}/'.format(country)
     filenames = [os.path.join(dirpath, f)
@@ -53,7 +69,7 @@ def main():
         #check required columns
         for k in required_fields:
             if k not in csvfile.fieldnames:
-                abort('no {} column in {}: {}'.format(k, filename, e))                    
+                abort('no {} column in {}'.format(k, filename))
 
         for row in csvfile:
 
@@ -67,11 +83,11 @@ def main():
 
             if id_ in canonical_ids:
                 if incorrect_id in corrections:
-                    print('incorrectId {} in {} seen before: {}'.format(incorrect_id, filename, e))
+                    print('incorrectId {} in {} seen before'.format(incorrect_id, filename))
                 else:
                     corrections[incorrect_id] = row
             else:
-                print('id {} in {} not present in country csv file: {}'.format(id_, filename, e))
+                print('id {} in {} not present in country csv file'.format(id_, filename))
 
 
     # write output file
@@ -1,9 +1,12 @@
 import csv
 import os
-import re
+import sys
 import tempfile
 import urllib.request
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import division_id  # noqa: E402
+
 
 def get_csv_data(url):
     tmp = tempfile.NamedTemporaryFile()
@@ -47,9 +50,7 @@ def make_slug(name):
     slug = slug.replace('&', 'and')
 
     # Follow OCD slugging rules:
-    slug = re.sub('\.? ', '_', slug)
-    slug = re.sub('[^\w0-9~_.-]', '~', slug, re.UNICODE)
-    return slug
+    return division_id.slugify(slug)
 
 
 def make_id(prefix, name):
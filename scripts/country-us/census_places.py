@@ -1,15 +1,23 @@
 #!/usr/bin/env python
+import io
 import re
 import os
 import sys
 import csv
-import codecs
+import hashlib
+import tempfile
+import urllib.parse
 import urllib.request
 import zipfile
 import argparse
 import collections
+import concurrent.futures
 import us
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import division_id  # noqa: E402
+from replacements import ReplacementTable  # noqa: E402
+
 
 VINTAGE = "14"
 SLUG = "census_geoid_{}".format(VINTAGE)
@@ -42,6 +50,11 @@ def _ordinal(value):
 
 BASE_URL = 'http://www2.census.gov/geo/gazetteer/20{}_Gazetteer/'.format(VINTAGE)
 
+# downloaded zips are kept here, named by their SHA-256, with urls/ recording each url's hash
+CACHE_DIR = os.environ.get('GAZ_CACHE_DIR', 'cache/census')
+# a directory of already downloaded zips, named as in their urls, to use instead of the network
+OFFLINE_DIR = os.environ.get('GAZ_OFFLINE_DIR')
+
 TYPES = {
     'county': {
         'zip': '20{}_Gaz_counties_national.zip'.format(VINTAGE),
@@ -137,6 +150,9 @@ TYPES = {
     },
 }
 
+# a county subdivision's GEOID starts with its county's GEOID: state and county FIPS codes
+COUNTY_GEOID_LENGTH = 5
+
 # list of rules for how to handle subdivs
 #   prefix - these are strictly within counties and need to be id'd as such
 #   town - these are the equivalent of places
@@ -168,28 +184,98 @@ def make_id(parent=None, **kwargs):
     if len(kwargs) > 1:
         raise ValueError('only one kwarg is allowed for make_id')
     type, type_id = list(kwargs.items())[0]
-    if not re.match('^[a-z_]+$', type):
-        raise ValueError('type must match [a-z]+ [%s]' % type)
     type_id = type_id.lower()
     if type == 'state' and type_id == 'pr':
         type = 'territory'
     elif type == 'state' and type_id == 'dc':
         type = 'district'
-    type_id = re.sub('\.? ', '_', type_id)
-    type_id = re.sub('[^\w0-9~_.-]', '~', type_id, re.UNICODE)
-    if parent:
-        return '{parent}/{type}:{type_id}'.format(parent=parent, type=type, type_id=type_id)
-    else:
-        return 'ocd-division/country:us/{type}:{type_id}'.format(type=type, type_id=type_id)
+    return division_id.make_id(parent or 'ocd-division/country:us', type, type_id)
 
 
-def open_gaz_zip(url):
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _index_entry(cache_dir, url):
+    """
+    the file recording which cached zip holds url
+
+    Each url has its own entry, written whole and moved into place, so
+    workers downloading different zips at once never overwrite each
+    other's entries.
+    """
+    return os.path.join(cache_dir, 'urls', hashlib.sha1(url.encode('UTF-8')).hexdigest())
+
+
+def _cached_sha256(cache_dir, url):
+    """ return the SHA-256 recorded for url's cached zip, or None """
+    try:
+        with open(_index_entry(cache_dir, url)) as fh:
+            return fh.read().split()[0]
+    except (FileNotFoundError, IndexError):
+        return None
+
+
+def _download(url, cache_dir):
+    """ download url into cache_dir, returning its path and recording it in the index """
     print('fetching zipfile', url)
-    zf, _ = urllib.request.urlretrieve(url)
-    zf = zipfile.ZipFile(zf)
-    localfile = zf.extract(zf.filelist[0], '/tmp/')
-    data = codecs.open(localfile, encoding='latin1')
-    return csv.DictReader(data, dialect=TabDelimited)
+    entry = _index_entry(cache_dir, url)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    digest = hashlib.sha256()
+    out = tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False)
+    try:
+        with urllib.request.urlopen(url) as response, out:
+            for chunk in iter(lambda: response.read(1 << 20), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        path = os.path.join(cache_dir, digest.hexdigest() + '.zip')
+        os.replace(out.name, path)
+    except BaseException:
+        os.unlink(out.name)
+        raise
+
+    # the url is kept alongside the hash, as in sha256sum output, for whoever looks
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(entry), suffix='.tmp', delete=False) as fh:
+        fh.write('{}  {}\n'.format(digest.hexdigest(), url))
+    os.replace(fh.name, entry)
+    return path
+
+
+def fetch_gaz_zip(url, cache_dir=None, offline_dir=None):
+    """
+    return the path of a local copy of the zip at url
+
+    With offline_dir (or GAZ_OFFLINE_DIR) the zip is taken from that
+    directory, or failing that the cache, and the network is never used.
+    Otherwise a cached copy whose contents still match its hash is used
+    and only missing or damaged zips are downloaded.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    offline_dir = offline_dir or OFFLINE_DIR
+    if offline_dir:
+        path = os.path.join(offline_dir, os.path.basename(urllib.parse.urlsplit(url).path))
+        if os.path.exists(path):
+            return path
+
+    sha256 = _cached_sha256(cache_dir, url)
+    if sha256:
+        path = os.path.join(cache_dir, sha256 + '.zip')
+        if os.path.exists(path) and _sha256(path) == sha256:
+            return path
+    if offline_dir:
+        raise FileNotFoundError('{} is not in {} or the cache {}'.format(url, offline_dir, cache_dir))
+    return _download(url, cache_dir)
+
+
+def open_gaz_zip(url):
+    """ yield the rows of the gazetteer in the zip at url, read straight out of the archive """
+    with zipfile.ZipFile(fetch_gaz_zip(url)) as zf, zf.open(zf.filelist[0]) as member:
+        yield from csv.DictReader(io.TextIOWrapper(member, encoding='latin1', newline=''),
+                                  dialect=TabDelimited)
 
 
 class Skip(Exception):
@@ -327,6 +413,21 @@ class SLDProcessor(Processor):
         ("Twentieth", "20th",),
         (' District', ''),
     )
+    replacement_table = ReplacementTable(replacements)
+
+    # special PR roman numeral replacement
+    pr_numerals = ReplacementTable((
+        ('VIII', '8'),
+        ('VII', '7'),
+        ('VI', '6'),
+        ('IV', '4'),
+        ('V', '5'),
+        ('III', '3'),
+        ('II', '2'),
+        ('I', '1'),
+    ))
+    ak_district = re.compile(r'(\d+)(.*)')
+    nh_district = re.compile(r'(\d+) (\w*) County')
 
     def get_urls(self):
         yield ('', BASE_URL + '20{}_Gaz_{}_national.zip'.format(
@@ -335,6 +436,18 @@ class SLDProcessor(Processor):
                'https://www.census.gov/geo/maps-data/data/docs/gazetteer'
                '/Gaz_{}_national.zip'.format(self.district_type), {})
 
+    @classmethod
+    def clean_district(cls, usps, name):
+        """ return the district part of the id for a gazetteer NAME """
+        district = cls.replacement_table.apply(name)
+        if usps == 'PR':
+            district = cls.pr_numerals.apply(district)
+        elif usps == 'AK':
+            district = cls.ak_district.sub(r'\1', district)
+        elif usps == 'NH':
+            district = cls.nh_district.sub(r'\2 \1', district)
+        return district.strip().lstrip('0')
+
     def process_row(self, row):
         state = us.states.lookup(row['USPS'])
 
@@ -342,28 +455,7 @@ class SLDProcessor(Processor):
         if 'not defined' in row['NAME']:
             raise Skip()
 
-        district = row['NAME']
-        for k, v in self.replacements:
-            district = district.replace(k, v)
-
-        # special PR roman numeral replacement
-        if row['USPS'] == 'PR':
-            for k, v in (
-                ('VIII', '8'),
-                ('VII', '7'),
-                ('VI', '6'),
-                ('IV', '4'),
-                ('V', '5'),
-                ('III', '3'),
-                ('II', '2'),
-                ('I', '1'),
-            ):
-                district = district.replace(k, v)
-        elif row['USPS'] == 'AK':
-            district = re.sub(r'(\d+)(.*)', r'\1', district)
-        elif row['USPS'] == 'NH':
-            district = re.sub(r'(\d+) (\w*) County', r'\2 \1', district)
-        district = district.strip().lstrip('0')
+        district = self.clean_district(row['USPS'], row['NAME'])
 
         # CHANGE: undo district lowercasing
         name = "{} {}".format(state, row['NAME'].replace('District', 'district'))
@@ -387,9 +479,70 @@ class SLDLProcessor(SLDProcessor):
     district_type = 'sldl'
 
 
-def process_types(types):
+def parse_type(entity_type):
+    """
+    read one gazetteer and return (rows, funcstat counts, type counts), where
+    rows are (row, name, subtype) for each active division in file order
+
+    Gazetteers are independent, so this runs in a worker process per type;
+    ids are assigned afterwards by process_types since subdivisions need
+    the county ids.
+    """
+    funcstat_count = collections.Counter()
+    type_count = collections.Counter()
+    parsed = []
+    url = BASE_URL + TYPES[entity_type]['zip']
+    funcstat_func = TYPES[entity_type]['funcstat']
+    overrides = TYPES[entity_type]['overrides']
+    id_overrides = TYPES[entity_type]['id_overrides']
+    rows = open_gaz_zip(url)
+
+    for row in rows:
+        state = row['USPS'].lower()
+        name = row['NAME']
+
+        subdiv_rule = SUBDIV_RULES.get(state)
+
+        row['_FUNCSTAT'] = funcstat = funcstat_func(row)
+        funcstat_count[funcstat] += 1
+
+        # skip inactive/fictitious/nonfunctioning/statistical/consolidated
+        # http://www.census.gov/geo/reference/gtc/gtc_area_attr.html#status
+        if funcstat in ('F', 'N', 'S', 'C', 'G'):
+            continue
+        if funcstat not in ('A', 'B', 'I'):
+            # unknown type
+            raise Exception(row)
+        if entity_type == 'subdiv' and not subdiv_rule:
+            raise Exception('unexpected subdiv in {}: {}'.format(state, row))
+
+        if name in overrides:
+            name, subtype = overrides[name]
+        elif row['GEOID'] in id_overrides:
+            name, subtype = id_overrides[row['GEOID']]
+        else:
+            for ending, subtype in TYPES[entity_type]['type_mapping'].items():
+                if name.endswith(ending):
+                    name = name.replace(ending, '')
+                    break
+            else:
+                # skip independent cities indicated at county level
+                if (entity_type == 'county' and (name.endswith(' city') or
+                                                 name == 'Carson City')):
+                    continue
+                else:
+                    raise ValueError('unknown ending: {} for {}'.format(name, row))
+
+        type_count[subtype] += 1
+        parsed.append((row, name, subtype))
+
+    return parsed, funcstat_count, type_count
+
+
+def process_types(types, jobs=None):
     funcstat_count = collections.Counter()
     type_count = collections.Counter()
+    # county GEOID -> id, for finding the parents of prefix subdivs
     counties = {}
     ids = {}
     # list of rows that produced an id
@@ -399,61 +552,29 @@ def process_types(types):
         ('id', 'name', SLUG))
     csvfile.writeheader()
 
-    for entity_type in types:
-        url = BASE_URL + TYPES[entity_type]['zip']
-        funcstat_func = TYPES[entity_type]['funcstat']
-        overrides = TYPES[entity_type]['overrides']
-        id_overrides = TYPES[entity_type]['id_overrides']
-        rows = open_gaz_zip(url)
+    jobs = min(len(types), jobs or os.cpu_count() or 1)
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = list(executor.map(parse_type, types))
+    else:
+        parsed = [parse_type(entity_type) for entity_type in types]
 
-        for row in rows:
-            state = row['USPS'].lower()
-            name = row['NAME']
+    # merge in the order given, exactly as if the types had been read one after another
+    for entity_type, (rows, type_funcstats, type_types) in zip(types, parsed):
+        funcstat_count.update(type_funcstats)
+        type_count.update(type_types)
 
-            subdiv_rule = SUBDIV_RULES.get(state)
+        for row, name, subtype in rows:
+            state = row['USPS'].lower()
             parent_id = make_id(state=state)
 
-            row['_FUNCSTAT'] = funcstat = funcstat_func(row)
-            funcstat_count[funcstat] += 1
-
-            # skip inactive/fictitious/nonfunctioning/statistical/consolidated
-            # http://www.census.gov/geo/reference/gtc/gtc_area_attr.html#status
-            if funcstat in ('F', 'N', 'S', 'C', 'G'):
-                continue
-            if funcstat not in ('A', 'B', 'I'):
-                # unknown type
-                raise Exception(row)
-            if entity_type == 'subdiv' and not subdiv_rule:
-                raise Exception('unexpected subdiv in {}: {}'.format(state, row))
-
-            if name in overrides:
-                name, subtype = overrides[name]
-            elif row['GEOID'] in id_overrides:
-                name, subtype = id_overrides[row['GEOID']]
-            else:
-                for ending, subtype in TYPES[entity_type]['type_mapping'].items():
-                    if name.endswith(ending):
-                        name = name.replace(ending, '')
-                        break
-                else:
-                    # skip independent cities indicated at county level
-                    if (entity_type == 'county' and (name.endswith(' city') or
-                                                     name == 'Carson City')):
-                        continue
-                    else:
-                        raise ValueError('unknown ending: {} for {}'.format(name, row))
-
-            type_count[subtype] += 1
-
-            if entity_type == 'subdiv' and subdiv_rule == 'prefix':
+            if entity_type == 'subdiv' and SUBDIV_RULES[state] == 'prefix':
                 # find county id
-                for geoid, countyid in counties.items():
-                    if row['GEOID'].startswith(geoid):
-                        id = make_id(parent=countyid, **{subtype: name})
-                        break
-                else:
+                countyid = counties.get(row['GEOID'][:COUNTY_GEOID_LENGTH])
+                if countyid is None:
                     raise Exception('{} had no parent county'.format(row))
-            elif entity_type != 'subdiv' or subdiv_rule == 'town':
+                id = make_id(parent=countyid, **{subtype: name})
+            else:
                 id = make_id(parent=parent_id, **{subtype: name})
 
             # duplicates
@@ -489,6 +610,16 @@ def process_types(types):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate census division ids from gazetteers')
+    parser.add_argument('--cache_dir', default=CACHE_DIR, help='where downloaded zips are kept')
+    parser.add_argument('--offline', metavar='DIR', default=OFFLINE_DIR,
+                        help='read zips from this directory and the cache, never the network')
+    args = parser.parse_args()
+    # through the environment so that worker processes see them too
+    os.environ['GAZ_CACHE_DIR'] = CACHE_DIR = args.cache_dir
+    if args.offline:
+        os.environ['GAZ_OFFLINE_DIR'] = OFFLINE_DIR = args.offline
+
     # process_types(('county', 'place', 'subdiv'))
     #CDProcessor().process()
     SLDUProcessor().process()
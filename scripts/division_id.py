@@ -0,0 +1,137 @@
+"""
+Parsing and validation of OCD division ids.
+
+An id is 'ocd-division/country:xx' (or 'region:xx') followed by any number
+of '/type:value' segments.  parse_id validates and splits an id in a single
+left-to-right pass; no check backtracks more than linearly, so the cost is
+linear in the length of the id.  Parents are cached, since siblings share them and
+ids are usually seen in groups.
+
+slugify and make_id build ids from names by the OCD slugging rules, for the
+generator scripts: lowercase, '_' for a space (and any period before it),
+'~' for anything else that isn't a word character, '~', '.' or '-'.
+Names repeat within and across files, so slugs and ids are cached too.
+"""
+import re
+import string
+import functools
+import collections
+
+# type:value, where a type is two or more letters/underscores with at most
+# one inner hyphen.  Unlike [^\W\d]+-?[^\W\d]+ this form can only fail one
+# way at each character, so it never backtracks quadratically.
+_SEGMENT = re.compile(r'([^\W\d](?:[^\W\d]*-[^\W\d]+|[^\W\d]+)):([\w.~-]+)')
+_CODE_CHARS = re.compile(r'[a-z]{2}')
+# for the common lowercase ASCII, hyphen-free segment, str.strip is a cheaper check
+_ASCII_TYPE_CHARS = string.ascii_lowercase + '_'
+_ASCII_VALUE_CHARS = string.ascii_lowercase + string.digits + '_.~-'
+ROOT_TYPES = ('country', 'region')
+
+PARENT_CACHE_SIZE = 65536
+SLUG_CACHE_SIZE = 65536
+
+_SLUG_SPACE = re.compile(r'\.? ')
+_SLUG_INVALID = re.compile(r'[^\w~.-]')
+_MAKE_ID_TYPE = re.compile(r'[a-z_]+')
+
+
+class DivisionId(collections.namedtuple('DivisionId', 'id country parts parent')):
+    """
+    a parsed division id
+
+    id      -- the full id string
+    country -- the two letter country (or region) code
+    parts   -- tuple of (type, value) pairs, starting with ('country', code)
+    parent  -- the parent id, or None for a country or region
+    """
+    __slots__ = ()
+
+    @property
+    def type(self):
+        return self.parts[-1][0]
+
+    @property
+    def value(self):
+        return self.parts[-1][1]
+
+
+_new_id = tuple.__new__
+
+
+def _parse_segment(segment, id_):
+    if segment.isascii():
+        type_, sep, value = segment.partition(':')
+        if (sep and len(type_) > 1 and value and
+                not type_.strip(_ASCII_TYPE_CHARS) and not value.strip(_ASCII_VALUE_CHARS)):
+            return type_, value
+    match = _SEGMENT.fullmatch(segment)
+    if not match or segment.lower() != segment:
+        raise ValueError('invalid id: ' + id_)
+    return match.groups()
+
+
+def _parse(id_):
+    """ parse an id without consulting the parent cache """
+    if id_.lower() != id_:
+        raise ValueError('invalid id: ' + id_)
+    segments = id_.split('/')
+    if len(segments) < 2 or segments[0] != 'ocd-division':
+        raise ValueError('invalid id: ' + id_)
+    kind, sep, code = segments[1].partition(':')
+    if kind not in ROOT_TYPES or not _CODE_CHARS.fullmatch(code):
+        raise ValueError('invalid id: ' + id_)
+    parts = [(kind, code)]
+    for segment in segments[2:]:
+        parts.append(_parse_segment(segment, id_))
+    parent = id_.rsplit('/', 1)[0] if len(parts) > 1 else None
+    return DivisionId(id_, code, tuple(parts), parent)
+
+
+@functools.lru_cache(maxsize=PARENT_CACHE_SIZE)
+def _parse_parent(parent):
+    return _parse(parent)
+
+
+def parse_id(id_):
+    """
+    validate an id and split it into a DivisionId
+
+    Raises ValueError for anything that isn't a well-formed, lowercase id.
+    """
+    parent, _, segment = id_.rpartition('/')
+    if '/' not in parent:
+        return _parse(id_)
+    try:
+        parsed_parent = _parse_parent(parent)
+    except ValueError:
+        raise ValueError('invalid id: ' + id_) from None
+    parts = parsed_parent[2] + (_parse_segment(segment, id_),)
+    return _new_id(DivisionId, (id_, parsed_parent[1], parts, parent))
+
+
+def validate_id(id_):
+    """ raise ValueError if id_ is not a valid division id """
+    parse_id(id_)
+
+
+@functools.lru_cache(maxsize=SLUG_CACHE_SIZE)
+def slugify(name):
+    """ return name as an id value, following the OCD slugging rules """
+    return _SLUG_INVALID.sub('~', _SLUG_SPACE.sub('_', name.lower()))
+
+
+def slugify_many(names):
+    """ return [slugify(name) for name in names], for slugging a whole column """
+    return list(map(slugify, names))
+
+
+@functools.lru_cache(maxsize=SLUG_CACHE_SIZE)
+def make_id(parent, type_, name):
+    """
+    return the id of the division of type type_ named name under parent
+
+    Raises ValueError if type_ isn't lowercase letters and underscores.
+    """
+    if not _MAKE_ID_TYPE.fullmatch(type_):
+        raise ValueError('type must match [a-z_]+ [{}]'.format(type_))
+    return '{}/{}:{}'.format(parent, type_, slugify(name))
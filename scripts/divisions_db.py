@@ -0,0 +1,99 @@
+"""
+SQLite export of compiled divisions.
+
+write_db stores a compiled country in a single ``divisions`` table, with the
+parent id and type split out of each id and indexes on the columns consumers
+look things up by, so an id, its children, or the division for an external
+code can be found without loading the whole CSV:
+
+    db = DivisionsDB('identifiers/country-us.sqlite')
+    db.get('ocd-division/country:us/state:ny')
+    db.children('ocd-division/country:us/state:ny', type_='county')
+    db.find('census_geoid_14', '3651000')
+"""
+import os
+import sqlite3
+
+from division_id import parse_id
+
+
+def _quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def write_db(result, path, unique_fields=()):
+    """
+    write a CompileResult to a new SQLite database at path
+
+    Every field gets a column.  id, (parent, type), type and each of
+    unique_fields are indexed; the database is built next to path and
+    moved into place once complete.
+    """
+    fields = [field for field in result.field_order if field != 'id']
+    columns = ['id', 'parent', 'type'] + fields
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('CREATE TABLE divisions (id TEXT PRIMARY KEY, parent TEXT, type TEXT{})'.format(
+            ''.join(', {} TEXT'.format(_quote(field)) for field in fields)))
+
+        def rows():
+            for row in result.sorted_rows():
+                parsed = parse_id(row[0])
+                yield [row[0], parsed.parent, parsed.type] + [val or None for val in row[1:]]
+
+        conn.executemany('INSERT INTO divisions ({}) VALUES ({})'.format(
+            ', '.join(map(_quote, columns)), ', '.join('?' * len(columns))), rows())
+
+        conn.execute('CREATE INDEX divisions_parent ON divisions (parent, type)')
+        conn.execute('CREATE INDEX divisions_type ON divisions (type)')
+        for field in unique_fields:
+            if field in fields:
+                # most external codes are only set on a few divisions, so leave NULLs out
+                conn.execute('CREATE INDEX {0} ON divisions ({1}) WHERE {1} IS NOT NULL'.format(
+                    _quote('divisions_' + field), _quote(field)))
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+
+
+class DivisionsDB(object):
+    """ indexed lookups against a database written by write_db """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+        self.conn.row_factory = sqlite3.Row
+        self.columns = [row[1] for row in self.conn.execute('PRAGMA table_info(divisions)')]
+
+    def _records(self, where, params):
+        cursor = self.conn.execute('SELECT * FROM divisions WHERE ' + where, params)
+        return [{key: row[key] for key in row.keys() if row[key] is not None} for row in cursor]
+
+    def get(self, id_):
+        """ return the record for id_ as a dict, or None """
+        records = self._records('id = ?', (id_,))
+        return records[0] if records else None
+
+    def __contains__(self, id_):
+        return self.conn.execute('SELECT 1 FROM divisions WHERE id = ?', (id_,)).fetchone() is not None
+
+    def children(self, parent, type_=None):
+        """ return the records directly under parent, optionally of one type """
+        if type_:
+            return self._records('parent = ? AND type = ? ORDER BY id', (parent, type_))
+        return self._records('parent = ? ORDER BY id', (parent,))
+
+    def find(self, field, value):
+        """ return the records whose field equals value """
+        if field not in self.columns:
+            raise KeyError(field)
+        return self._records('{} = ? ORDER BY id'.format(_quote(field)), (value,))
+
+    def close(self):
+        self.conn.close()
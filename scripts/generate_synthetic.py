@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic country for scale testing the compile, corrections
+and matching scripts.
+
+Writes identifiers/country-zz/ (and corrections/country-zz/) under ROOT,
+never into the repository by default, shaped like country-us: a file of
+states, one local_gov file per state with counties, places, wards and
+precincts below it, a census file giving unique geoids to an overlapping
+share of those divisions, sameAs aliases, validThrough dates, and
+corrections pointing at real ids.  The same seed and options always give
+the same files.  Compiling it with compile.py checks the ids, but only
+bench_compile.py and the tests pass UNIQUE_FIELDS to check the geoids.
+
+    ./scripts/generate_synthetic.py /tmp/synthetic --divisions 1000000
+    cd /tmp/synthetic && /path/to/scripts/compile.py zz
+
+Rows are streamed to disk as they are generated, so memory use doesn't
+grow with --divisions.
+"""
+import os
+import csv
+import random
+import argparse
+
+SYLLABLES = ['an', 'ber', 'cal', 'dor', 'el', 'fen', 'gar', 'ham', 'is', 'jor', 'kel', 'lan',
+             'mar', 'nor', 'o', 'pen', 'quin', 'ros', 'sal', 'tor', 'u', 'val', 'wes', 'yor']
+LEVELS = [
+    # (type, name format, whether the value is a number)
+    ('state', '{}', False),
+    ('county', '{} County', False),
+    ('place', '{}', False),
+    ('ward', 'Ward {}', True),
+    ('precinct', 'Precinct {}', True),
+]
+# the fields that are unique across the country, to pass as
+# compile_country's unique_fields, since the synthetic country has no
+# entry in compile.COUNTRY_UNIQUE_FIELDS
+UNIQUE_FIELDS = ['census_geoid']
+
+
+def fanout_for(divisions, states, depth):
+    """ the children per division that gives about divisions in total """
+    if depth == 1:
+        return 0.0
+    lo, hi = 1.0, float(divisions)
+    for _ in range(100):
+        fanout = (lo + hi) / 2
+        total = states * sum(fanout ** level for level in range(depth))
+        if total > divisions:
+            hi = fanout
+        else:
+            lo = fanout
+    return lo
+
+
+class Generator(object):
+    """ streams one synthetic country's source files under root """
+
+    def __init__(self, root, country='zz', divisions=100000, states=50, depth=5, seed=0,
+                 overlap=0.3, aliases=0.01, valid_through=0.02, corrections=0.005):
+        self.root = root
+        self.country = country
+        self.states = states
+        self.depth = min(max(depth, 1), len(LEVELS))
+        self.fanout = fanout_for(divisions, states, self.depth)
+        self.rng = random.Random(seed)
+        self.overlap = overlap
+        self.aliases = aliases
+        self.valid_through = valid_through
+        self.corrections = corrections
+        self.counts = {'divisions': 0, 'census': 0, 'aliases': 0, 'corrections': 0}
+        self._geoid = 0
+
+    def _name(self):
+        syllables = self.rng.choice((2, 2, 3, 3, 4))
+        return ''.join(self.rng.choice(SYLLABLES) for _ in range(syllables)).capitalize()
+
+    def _children(self, parent, level):
+        """ yield (id, name, type, value) for a random number of children of parent """
+        type_, name_format, numbered = LEVELS[level]
+        count = max(1, int(round(self.fanout * self.rng.uniform(0.5, 1.5))))
+        seen = set()
+        for i in range(1, count + 1):
+            if numbered:
+                value, name = str(i), name_format.format(i)
+            else:
+                base = self._name()
+                value, name = base.lower(), name_format.format(base)
+                suffix = 2
+                while value in seen:
+                    value, name = '{}_{}'.format(base.lower(), suffix), name_format.format('{} {}'.format(base, suffix))
+                    suffix += 1
+            seen.add(value)
+            yield '{}/{}:{}'.format(parent, type_, value), name, type_, value
+
+    def _write_tree(self, parent, level, state_index, local, extras):
+        for id_, name, type_, value in self._children(parent, level):
+            valid_through = ''
+            if type_ == 'place' and self.rng.random() < self.valid_through:
+                valid_through = '{}-12-31'.format(self.rng.randint(2000, 2020))
+            local.writerow([id_, name, valid_through])
+            self.counts['divisions'] += 1
+            self._write_extras(id_, name, type_, value, state_index, extras)
+            if level + 1 < self.depth:
+                self._write_tree(id_, level + 1, state_index, local, extras)
+
+    def _write_extras(self, id_, name, type_, value, state_index, extras):
+        census, aliases, corrections = extras
+        rng = self.rng
+        if rng.random() < self.overlap:
+            self._geoid += 1
+            census.writerow([id_, name, '{:02d}{:08d}'.format(state_index, self._geoid)])
+            self.counts['census'] += 1
+        if type_ == 'place' and rng.random() < self.aliases:
+            aliases.writerow([id_ + '_former', id_, 'renamed'])
+            self.counts['aliases'] += 1
+        if rng.random() < self.corrections and not value.isdigit():
+            corrections.writerow([id_ + '.', id_, 'stray period'])
+            self.counts['corrections'] += 1
+
+    def generate(self):
+        """ write every file and return counts of what was written """
+        country_id = 'ocd-division/country:{}'.format(self.country)
+        base = os.path.join(self.root, 'identifiers', 'country-{}'.format(self.country))
+        census_dir = os.path.join(base, 'census_autogenerated')
+        corrections_dir = os.path.join(self.root, 'corrections', 'country-{}'.format(self.country))
+        for path in (census_dir, corrections_dir):
+            os.makedirs(path, exist_ok=True)
+
+        with open(os.path.join(base, 'country.csv'), 'w', encoding='UTF-8') as country_fh, \
+                open(os.path.join(census_dir, '{}_census.csv'.format(self.country)), 'w', encoding='UTF-8') as census_fh, \
+                open(os.path.join(base, 'aliases.csv'), 'w', encoding='UTF-8') as aliases_fh, \
+                open(os.path.join(corrections_dir, 'generated.csv'), 'w', encoding='UTF-8') as corrections_fh:
+            country = csv.writer(country_fh)
+            extras = (csv.writer(census_fh), csv.writer(aliases_fh), csv.writer(corrections_fh))
+            country.writerow(['id', 'name'])
+            extras[0].writerow(['id', 'name', 'census_geoid'])
+            extras[1].writerow(['id', 'sameAs', 'sameAsNote'])
+            extras[2].writerow(['incorrectId', 'id', 'note'])
+
+            country.writerow([country_id, 'Synthetic Country {}'.format(self.country.upper())])
+            self.counts['divisions'] += 1
+            for state_index in range(self.states):
+                state_value = '{}{}'.format(chr(ord('a') + state_index // 26 % 26), chr(ord('a') + state_index % 26))
+                state_id = '{}/state:{}'.format(country_id, state_value)
+                country.writerow([state_id, 'State {}'.format(state_value.upper())])
+                self.counts['divisions'] += 1
+                if self.depth == 1:
+                    continue
+                with open(os.path.join(base, 'state-{}-local_gov.csv'.format(state_value)), 'w',
+                          encoding='UTF-8') as local_fh:
+                    local = csv.writer(local_fh)
+                    local.writerow(['id', 'name', 'validThrough'])
+                    self._write_tree(state_id, 1, state_index, local, extras)
+        return self.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='generate a synthetic country for scale tests')
+    parser.add_argument('root', help='directory to write identifiers/ and corrections/ under')
+    parser.add_argument('--country', default='zz', help='two letter code of the generated country')
+    parser.add_argument('--divisions', type=int, default=100000, help='approximate number of divisions')
+    parser.add_argument('--states', type=int, default=50, help='number of top-level divisions')
+    parser.add_argument('--depth', type=int, default=5,
+                        help='levels below the country: state, county, place, ward, precinct')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--overlap', type=float, default=0.3,
+                        help='share of divisions also listed, with a geoid, in the census file')
+    parser.add_argument('--aliases', type=float, default=0.01, help='share of places with a sameAs alias')
+    parser.add_argument('--valid_through', type=float, default=0.02, help='share of places with a validThrough date')
+    parser.add_argument('--corrections', type=float, default=0.005, help='share of divisions with a correction')
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.root, 'identifiers', 'country-{}'.format(args.country))):
+        parser.error('{} already has a country-{} tree'.format(args.root, args.country))
+    generator = Generator(args.root, args.country, args.divisions, args.states, args.depth, args.seed,
+                          args.overlap, args.aliases, args.valid_through, args.corrections)
+    counts = generator.generate()
+    print('wrote {divisions} divisions, {census} census rows, {aliases} aliases and {corrections} corrections'.format(
+        **counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Memory-mapped sorted lookup tables.
+
+An id table maps sorted string keys (division ids) to string values (names)
+in a flat file that is used in place through mmap, so opening one costs no
+parsing and every process shares the same pages.  The layout, all
+little-endian, is:
+
+    magic            8 bytes, b'OCDIDT\\x00\\x01'
+    count            u64, number of keys
+    key offsets      (count + 1) u64 file offsets, key i is [off[i], off[i+1])
+    value offsets    (count + 1) u64 file offsets, likewise for values
+    key heap         UTF-8 keys, concatenated in sorted order
+    value heap       UTF-8 values, concatenated in key order
+
+Lookups are a binary search over the key offsets, O(log n) slices of the
+mapped file.
+"""
+import os
+import sys
+import mmap
+import array
+import struct
+
+MAGIC = b'OCDIDT\x00\x01'
+_HEADER = struct.Struct('<8sQ')
+
+
+def write_idtable(path, items):
+    """
+    write (key, value) pairs, sorted by key with no duplicates, to path
+
+    The file is written next to path and moved into place once complete.
+    """
+    keys = []
+    values = []
+    previous = None
+    for key, value in items:
+        key = key.encode('UTF-8')
+        if previous is not None and key <= previous:
+            raise ValueError('keys must be sorted and unique: {!r}'.format(key.decode('UTF-8')))
+        keys.append(key)
+        values.append((value or '').encode('UTF-8'))
+        previous = key
+
+    count = len(keys)
+    key_offsets = array.array('Q')
+    value_offsets = array.array('Q')
+    offset = _HEADER.size + 2 * 8 * (count + 1)
+    for heap, offsets in ((keys, key_offsets), (values, value_offsets)):
+        for item in heap:
+            offsets.append(offset)
+            offset += len(item)
+        offsets.append(offset)
+    if sys.byteorder != 'little':
+        key_offsets.byteswap()
+        value_offsets.byteswap()
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(_HEADER.pack(MAGIC, count))
+        out.write(key_offsets.tobytes())
+        out.write(value_offsets.tobytes())
+        out.writelines(keys)
+        out.writelines(values)
+    os.replace(tmp_path, path)
+
+
+class IdTable(object):
+    """ read-only, memory-mapped view of a file written by write_idtable """
+
+    def __init__(self, path):
+        with open(path, 'rb') as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError('{} is not an id table'.format(path))
+        if sys.byteorder != 'little':
+            self._mm.close()
+            raise ValueError('id tables can only be mapped on little-endian machines')
+        # the offsets are read in place; these views must be released before the map is closed
+        self._views = [memoryview(self._mm)]
+        self._views.append(self._views[0][_HEADER.size:_HEADER.size + 16 * (self._count + 1)].cast('Q'))
+        self._views.append(self._views[1][:self._count + 1])
+        self._views.append(self._views[1][self._count + 1:])
+        self._key_offsets, self._value_offsets = self._views[2:]
+
+    def __len__(self):
+        return self._count
+
+    def _find(self, key):
+        """ return the index of key, or -1 """
+        target = key.encode('UTF-8')
+        mm = self._mm
+        offsets = self._key_offsets
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = mm[offsets[mid]:offsets[mid + 1]]
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def exists(self, key):
+        """ return True if key is in the table """
+        return self._find(key) >= 0
+
+    __contains__ = exists
+
+    def get(self, key, default=None):
+        """ return the value stored for key, or default """
+        index = self._find(key)
+        if index < 0:
+            return default
+        return self._mm[self._value_offsets[index]:self._value_offsets[index + 1]].decode('UTF-8')
+
+    def items(self):
+        """ yield every (key, value) pair in key order """
+        mm = self._mm
+        for i in range(self._count):
+            yield (mm[self._key_offsets[i]:self._key_offsets[i + 1]].decode('UTF-8'),
+                   mm[self._value_offsets[i]:self._value_offsets[i + 1]].decode('UTF-8'))
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Normalize a stream of division ids against the compiled data.
+
+Each id is trimmed and lowercased, replaced by its correction from
+corrections/country-xx.csv if it has one, and then resolved to its canonical
+id through identifiers/country-xx.canonical.idtable (written by
+compile.py --canonical_index).  Ids that still aren't known are flagged.
+
+    ./scripts/normalize_ids.py ids.csv --column ocdid > normalized.csv
+    some_export | ./scripts/normalize_ids.py --format jsonl > normalized.jsonl
+
+Rows are written back in the input format with two more fields,
+normalized_id and status, as soon as they are read, so memory use doesn't
+grow with the input.  A summary of the statuses goes to stderr.  From
+Python:
+
+    with normalize_ids.Normalizer() as normalizer:
+        normalizer.normalize(' OCD-Division/Country:US/State:AK/Place:Juneau ')
+        # ('ocd-division/country:us/state:ak/borough:juneau', 'aliased')
+        for normalized_id, status in normalizer.normalize_many(ids):
+            ...
+"""
+import os
+import sys
+import csv
+import json
+import argparse
+import functools
+import collections
+
+import bloom
+import division_id
+import canonical_index
+
+# statuses, in the order they are reported
+OK = 'ok'
+CORRECTED = 'corrected'
+ALIASED = 'aliased'
+CORRECTED_ALIASED = 'corrected,aliased'
+UNKNOWN = 'unknown'
+STATUSES = [OK, CORRECTED, ALIASED, CORRECTED_ALIASED, UNKNOWN]
+
+
+class MissingIndexError(Exception):
+    pass
+
+
+class Normalizer(object):
+    """
+    normalizes ids of any country, loading each country's corrections and
+    canonical index the first time one of its ids is seen
+    """
+
+    def __init__(self, identifiers_dir='identifiers', corrections_dir='corrections', cache_size=65536):
+        self.identifiers_dir = identifiers_dir
+        self.corrections_dir = corrections_dir
+        self._countries = {}
+        # repeated ids are common in exports; a bounded cache keeps memory flat
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+
+    def _country(self, code):
+        """
+        return (corrections dict, CanonicalIndex, BloomFilter or None) for a
+        country, or None if it has no compiled data
+        """
+        if code not in self._countries:
+            compiled = os.path.join(self.identifiers_dir, 'country-{}.csv'.format(code))
+            index_path = os.path.join(self.identifiers_dir, 'country-{}.canonical.idtable'.format(code))
+            if not os.path.exists(index_path):
+                if not os.path.exists(compiled):
+                    self._countries[code] = None
+                    return None
+                raise MissingIndexError('{} is missing, run compile.py {} --canonical_index'.format(
+                    index_path, code))
+            corrections = {}
+            corrections_file = os.path.join(self.corrections_dir, 'country-{}.csv'.format(code))
+            if os.path.exists(corrections_file):
+                with open(corrections_file, encoding='UTF-8') as fh:
+                    corrections = {row['incorrectId']: row['id'] for row in csv.DictReader(fh)}
+            # with compile.py --bloom, most unknown ids are rejected without a table lookup;
+            # a filter older than the index could reject new ids, so it is skipped
+            bloom_path = os.path.join(self.identifiers_dir, 'country-{}.bloom'.format(code))
+            bloom_filter = None
+            if os.path.exists(bloom_path) and os.path.getmtime(bloom_path) >= os.path.getmtime(index_path):
+                bloom_filter = bloom.BloomFilter(bloom_path)
+            self._countries[code] = (corrections, canonical_index.CanonicalIndex(index_path), bloom_filter)
+        return self._countries[code]
+
+    def _normalize(self, id_):
+        """ return (normalized id, status) for a raw id """
+        id_ = id_.strip().lower()
+        parts = id_.split('/', 2)
+        if len(parts) < 2 or parts[0] != 'ocd-division':
+            return id_, UNKNOWN
+        # a root is country:xx or region:xx, compiled to country-xx.csv either way
+        root_type, _, code = parts[1].partition(':')
+        if root_type not in division_id.ROOT_TYPES or not code:
+            return id_, UNKNOWN
+        country = self._country(code)
+        if country is None:
+            return id_, UNKNOWN
+        corrections, index, bloom_filter = country
+        corrected = corrections.get(id_)
+        if corrected is not None:
+            id_ = corrected
+        if bloom_filter is not None and not bloom_filter.might_contain(id_):
+            return id_, UNKNOWN
+        canonical = index.canonicalize(id_)
+        if canonical is None:
+            return id_, UNKNOWN
+        if canonical != id_:
+            return canonical, CORRECTED_ALIASED if corrected is not None else ALIASED
+        return id_, CORRECTED if corrected is not None else OK
+
+    def normalize_many(self, ids):
+        """ yield (normalized id, status) for each of an iterable of ids, lazily """
+        normalize = self.normalize
+        for id_ in ids:
+            yield normalize(id_)
+
+    def close(self):
+        for country in self._countries.values():
+            if country is not None:
+                for resource in country[1:]:
+                    if resource is not None:
+                        resource.close()
+        self._countries.clear()
+        self.normalize.cache_clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def normalize_csv(normalizer, infile, outfile, column='id'):
+    """ copy CSV rows from infile to outfile with normalized_id and status columns; return status counts """
+    counts = collections.Counter()
+    reader = csv.reader(infile)
+    header = next(reader, None)
+    if header is None:
+        return counts
+    try:
+        index = header.index(column)
+    except ValueError:
+        raise ValueError('input has no {} column'.format(column)) from None
+    writer = csv.writer(outfile, lineterminator='\n')
+    writer.writerow(header + ['normalized_id', 'status'])
+    normalize = normalizer.normalize
+    for row in reader:
+        normalized, status = normalize(row[index]) if index < len(row) else ('', UNKNOWN)
+        counts[status] += 1
+        row.append(normalized)
+        row.append(status)
+        writer.writerow(row)
+    return counts
+
+
+def normalize_jsonl(normalizer, infile, outfile, column='id'):
+    """ copy JSON lines from infile to outfile with normalized_id and status keys; return status counts """
+    counts = collections.Counter()
+    normalize = normalizer.normalize
+    for line in infile:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        normalized, status = normalize(record.get(column) or '')
+        counts[status] += 1
+        record['normalized_id'] = normalized
+        record['status'] = status
+        outfile.write(json.dumps(record, ensure_ascii=False))
+        outfile.write('\n')
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='normalize division ids with corrections and sameAs aliases')
+    parser.add_argument('input', nargs='?', default='-', help='CSV or JSON lines file of ids, - for stdin')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                        help='input format, by default taken from the file extension (csv for stdin)')
+    parser.add_argument('--column', default='id', help='column or key holding the ids')
+    parser.add_argument('--identifiers', default='identifiers',
+                        help='directory of compiled CSVs and their .canonical.idtable files')
+    parser.add_argument('--corrections', default='corrections', help='directory of compiled corrections')
+    parser.add_argument('--strict', action='store_true', help='exit with an error if any id is unknown')
+    args = parser.parse_args()
+
+    input_format = args.format
+    if input_format is None:
+        input_format = 'jsonl' if args.input.endswith(('.jsonl', '.ndjson')) else 'csv'
+    normalize = normalize_jsonl if input_format == 'jsonl' else normalize_csv
+
+    infile = sys.stdin if args.input == '-' else open(args.input, encoding='UTF-8', newline='')
+    try:
+        with Normalizer(args.identifiers, args.corrections) as normalizer:
+            counts = normalize(normalizer, infile, sys.stdout, args.column)
+    except (MissingIndexError, ValueError) as e:
+        sys.exit('normalize_ids: {}'.format(e))
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+    print(', '.join('{} {}'.format(counts[status], status) for status in STATUSES), file=sys.stderr)
+    if args.strict and counts[UNKNOWN]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Load test for ocdid_server.py on localhost.
+
+Opens --concurrency keep-alive connections, sends --requests requests spread
+across them and reports throughput and latency percentiles:
+
+    ./scripts/ocdid_server.py --port 8080 &
+    ./scripts/ocdid_loadtest.py --port 8080 --endpoint mix
+
+Request targets are drawn, with a fixed seed, from the ids in the compiled
+files, so is_ocdid and match_name requests hit real divisions.
+"""
+import csv
+import glob
+import json
+import time
+import random
+import asyncio
+import argparse
+import urllib.parse
+
+
+def load_ids(pattern, limit):
+    ids = []
+    for filename in sorted(glob.glob(pattern)):
+        with open(filename, encoding='UTF-8') as fh:
+            ids.extend(row['id'] for row in csv.DictReader(fh) if row['id'].count('/') > 1)
+    random.Random(0).shuffle(ids)
+    return ids[:limit]
+
+
+def make_requests(endpoint, ids, count, batch_size):
+    """ return (method, path, body) tuples for endpoint, cycling through ids """
+    rng = random.Random(1)
+    ops = ['is_ocdid', 'get_exception', 'match_name', 'name_search'] if endpoint == 'mix' else [endpoint]
+    requests = []
+    for i in range(count):
+        id_ = ids[i % len(ids)]
+        prefix, _, segment = id_.rpartition('/')
+        type_, _, name = segment.partition(':')
+        op = rng.choice(ops)
+        params = {'is_ocdid': {'id': id_}, 'get_exception': {'id': id_},
+                  'match_name': {'prefix': prefix, 'type': type_, 'name': name},
+                  'name_search': {'name': name}}.get(op)
+        if op == 'batch':
+            batch = []
+            for j in range(batch_size):
+                prefix, _, segment = ids[(i * batch_size + j) % len(ids)].rpartition('/')
+                type_, _, name = segment.partition(':')
+                batch.append({'op': 'match_name', 'prefix': prefix, 'type': type_, 'name': name})
+            requests.append(('POST', '/batch', json.dumps({'requests': batch}).encode('UTF-8')))
+        else:
+            requests.append(('GET', '/{}?{}'.format(op, urllib.parse.urlencode(params)), b''))
+    return requests
+
+
+async def client(host, port, requests, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for method, path, body in requests:
+            start = time.perf_counter()
+            writer.write('{} {} HTTP/1.1\r\nHost: {}\r\nContent-Length: {}\r\n\r\n'.format(
+                method, path, host, len(body)).encode('latin1') + body)
+            status = (await reader.readline()).split()[1]
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if status != b'200':
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    ids = load_ids(args.ids, args.requests * max(args.batch_size, 1))
+    requests = make_requests(args.endpoint, ids, args.requests, args.batch_size)
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args.host, args.port, requests[i::args.concurrency], latencies, errors)
+                           for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print('{} {} requests over {} connections in {:.2f}s, {} errors'.format(
+        len(latencies), args.endpoint, args.concurrency, elapsed, len(errors)))
+    print('   throughput {:>10.1f} req/s'.format(len(latencies) / elapsed))
+    print('   p50        {:>10.2f} ms'.format(percentile(0.50)))
+    print('   p99        {:>10.2f} ms'.format(percentile(0.99)))
+    print('   max        {:>10.2f} ms'.format(latencies[-1] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='load test a running ocdid_server.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--endpoint', default='is_ocdid',
+                        choices=['is_ocdid', 'get_exception', 'match_name', 'name_search', 'batch', 'mix'])
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--batch_size', type=int, default=100, help='match_name requests per batch')
+    parser.add_argument('--ids', default='identifiers/country-*.csv', help='glob of compiled CSVs to draw ids from')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
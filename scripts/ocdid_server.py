@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Small asyncio HTTP service for ocdid lookups and matching.
+
+Loads every compiled identifiers/country-*.csv once, plus the corrections
+used as exceptions, and answers JSON requests so workers don't each need
+their own copy of the data:
+
+    ./scripts/ocdid_server.py --port 8080
+
+    GET  /is_ocdid?id=ocd-division/country:us/state:ny
+    GET  /get_exception?id=...
+    GET  /match_name?prefix=ocd-division/country:us/state:al&type=county&name=marion
+    GET  /name_search?name=marion[&type=county]
+    POST /batch  {"requests": [{"op": "match_name", "prefix": ..., "type": ..., "name": ...}, ...]}
+    GET  /status
+
+A batch is answered in request order; its match_name requests go through
+ocdid.match_names, which processes each list of official names once.  The compiled files are polled for changes
+and the data is rebuilt in a worker thread, then swapped in at once, so
+every request sees either the old or the new data in full.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+import argparse
+import urllib.parse
+
+import ocdid
+
+MAX_BODY = 16 * 1024 * 1024
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _param(params, name):
+    try:
+        value = params[name]
+    except KeyError:
+        raise RequestError(400, 'missing parameter: ' + name) from None
+    if not isinstance(value, str):
+        raise RequestError(400, 'parameter must be a string: ' + name)
+    return value
+
+
+def _match_name(data, params):
+    try:
+        match, ratio = ocdid.match_name(_param(params, 'prefix'), _param(params, 'type'), _param(params, 'name'), data)
+    except KeyError:
+        raise RequestError(404, 'unknown prefix or type') from None
+    return {'ocdid': match, 'ratio': ratio}
+
+
+def _name_search(data, params):
+    if params.get('type'):
+        matches = ocdid.type_name_search(_param(params, 'type'), _param(params, 'name'), data)
+    else:
+        matches = ocdid.name_search(_param(params, 'name'), data)
+    return [{'ocdid': match, 'ratio': ratio} for ratio, match in matches]
+
+
+# op -> (function of (data, params), whether it is slow enough for a worker thread)
+OPERATIONS = {
+    'is_ocdid': (lambda data, params: ocdid.is_ocdid(_param(params, 'id'), data), False),
+    'get_exception': (lambda data, params: ocdid.get_exception(_param(params, 'id'), data), False),
+    'match_name': (_match_name, True),
+    'name_search': (_name_search, True),
+}
+
+
+def run_batch(data, requests):
+    """
+    answer a list of request dicts, scoring match_name requests together
+
+    A malformed item gets an error of its own; the rest are still answered.
+    """
+    if not isinstance(requests, list):
+        raise RequestError(400, 'requests must be a list')
+    results = [None] * len(requests)
+    matches = []
+    for i, params in enumerate(requests):
+        op = params.get('op') if isinstance(params, dict) else None
+        if not isinstance(op, str) or op not in OPERATIONS:
+            results[i] = {'error': 'unknown op: {}'.format(op)}
+        elif op == 'match_name' and all(isinstance(params.get(key), str) for key in ('prefix', 'type', 'name')):
+            matches.append(i)
+        else:
+            try:
+                results[i] = {'result': OPERATIONS[op][0](data, params)}
+            except RequestError as e:
+                results[i] = {'error': str(e)}
+
+    # rows with an unknown prefix or type are answered one at a time so the rest still batch
+    known = [i for i in matches if requests[i]['type'] in data.ocdids.get(requests[i]['prefix'], ())]
+    rows = [(requests[i]['prefix'], requests[i]['type'], requests[i]['name']) for i in known]
+    for i, (match, ratio) in zip(known, ocdid.match_names(rows, data)):
+        results[i] = {'result': {'ocdid': match, 'ratio': ratio}}
+    for i in set(matches) - set(known):
+        results[i] = {'error': 'unknown prefix or type'}
+    return results
+
+
+class Server(object):
+    """ serves ocdid lookups from data that is swapped wholesale on reload """
+
+    def __init__(self, pattern, exception_data=None, cache_file=None, poll_interval=2.0):
+        self.pattern = pattern
+        self.exception_data = exception_data
+        self.cache_file = cache_file
+        self.poll_interval = poll_interval
+        self.data = None
+        self.loaded_at = None
+        self.mtimes = None
+        self.requests = 0
+
+    def _snapshot(self):
+        return {filename: os.stat(filename).st_mtime_ns for filename in sorted(glob.glob(self.pattern))}
+
+    def load(self):
+        """ build OcdidData from the current files; runs in a worker thread """
+        mtimes = self._snapshot()
+        if not mtimes:
+            raise RuntimeError('no files match {}'.format(self.pattern))
+        data = ocdid.OcdidData.load(ocdid_data=list(mtimes), exception_data=self.exception_data,
+                                    cache_file=self.cache_file)
+        return data, mtimes
+
+    def swap(self, loaded):
+        self.data, self.mtimes = loaded
+        self.loaded_at = time.time()
+
+    async def watch(self):
+        """ poll the compiled files and reload when any is added, removed or changed """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if self._snapshot() == self.mtimes:
+                    continue
+                self.swap(await loop.run_in_executor(None, self.load))
+                print('reloaded {} files'.format(len(self.mtimes)), file=sys.stderr)
+            except Exception as e:
+                print('reload failed, keeping the loaded data: {}'.format(e), file=sys.stderr)
+
+    async def dispatch(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        path = url.path.strip('/')
+        data = self.data
+        loop = asyncio.get_running_loop()
+        if path == 'status':
+            return {'files': list(self.mtimes), 'loaded_at': self.loaded_at, 'requests': self.requests,
+                    'caches': ocdid.cache_info(data)}
+        if path == 'batch':
+            if method != 'POST':
+                raise RequestError(405, 'batch requests must be POSTed')
+            try:
+                requests = json.loads(body.decode('UTF-8'))['requests']
+            except (ValueError, KeyError, TypeError):
+                raise RequestError(400, 'expected a JSON object with a requests list') from None
+            return {'results': await loop.run_in_executor(None, run_batch, data, requests)}
+        if path not in OPERATIONS:
+            raise RequestError(404, 'unknown endpoint: /' + path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if method == 'POST' and body:
+            try:
+                params.update(json.loads(body.decode('UTF-8')))
+            except (ValueError, TypeError):
+                raise RequestError(400, 'expected a JSON object') from None
+        func, slow = OPERATIONS[path]
+        if slow:
+            return {'result': await loop.run_in_executor(None, func, data, params)}
+        return {'result': func(data, params)}
+
+    async def handle(self, reader, writer):
+        """ serve HTTP/1.1 requests on one connection until it is closed """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin1').split()
+                    length = int(headers.get('content-length', 0))
+                    if length > MAX_BODY:
+                        raise RequestError(413, 'request body too large')
+                    body = await reader.readexactly(length) if length else b''
+                    status, payload = 200, await self.dispatch(method, target, body)
+                except RequestError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except ValueError:
+                    status, payload = 400, {'error': 'malformed request'}
+                except Exception as e:
+                    status, payload = 500, {'error': repr(e)}
+                self.requests += 1
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                content = json.dumps(payload).encode('UTF-8')
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n{}\r\n'.format(
+                    status, REASONS[status], len(content), '' if keep_alive else 'Connection: close\r\n').encode('latin1'))
+                writer.write(content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        loop = asyncio.get_running_loop()
+        self.swap(await loop.run_in_executor(None, self.load))
+        print('loaded {} files, serving on http://{}:{}/'.format(len(self.mtimes), host, port), file=sys.stderr)
+        server = await asyncio.start_server(self.handle, host, port)
+        watcher = asyncio.ensure_future(self.watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='serve ocdid lookups over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--identifiers', default='identifiers/country-*.csv',
+                        help='glob of compiled CSVs to serve')
+    parser.add_argument('--exceptions', default=None, help='exception data, defaults to ocdid.EXCEPTION_DATA')
+    parser.add_argument('--cache_file', default='', help='pickle the built indexes here between runs')
+    parser.add_argument('--poll_interval', type=float, default=2.0,
+                        help='seconds between checks for changed identifier files')
+    args = parser.parse_args()
+
+    server = Server(args.identifiers, args.exceptions, args.cache_file, args.poll_interval)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Ordered string replacement tables compiled into a single scan.
+
+Generator scripts clean up names with a list of (old, new) pairs applied one
+after another with str.replace, so a later pair sees the output of earlier
+ones.  ReplacementTable gives exactly the same result, but first finds
+which keys can be in the string at all with one regular expression scan of
+every key, and only runs str.replace for those:
+
+    table = ReplacementTable((('Twenty-First', '21st'), ('First', '1st'), (' District', '')))
+    table.apply('Twenty-First District')    # '21st'
+
+The scan is a leftmost-longest match against a trie of the keys, so it reports each non-
+overlapping occurrence; a key it doesn't report can still be present only
+inside or across an occurrence of a key it overlaps with, and those keys
+are tried as well.  When a replacement changes the string, the keys after
+it are scanned for again, since the new text can contain them.  Results
+are memoized, as gazetteer names such as 'State Senate District 12' repeat
+across states.
+"""
+import re
+import functools
+
+
+def _trie_pattern(keys):
+    """
+    return a regex matching any of keys, factored into a trie so each
+    position is tried once per character rather than once per key
+
+    Optional suffixes are greedy, so the longest key at a position wins.
+    """
+    trie = {}
+    for key in keys:
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def pattern(node):
+        terminal = '' in node
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:{})'.format('|'.join(branches))
+        if terminal:
+            return '(?:{})?'.format(body)
+        return body
+
+    return pattern(trie)
+
+
+def _overlaps(a, b):
+    """ return True if a and b can share characters where they occur in a string """
+    if a in b or b in a:
+        return True
+    for i in range(1, min(len(a), len(b))):
+        if a.endswith(b[:i]) or b.endswith(a[:i]):
+            return True
+    return False
+
+
+class ReplacementTable(object):
+    """
+    an ordered sequence of (old, new) replacements applied as by repeated
+    str.replace, with results memoized for up to cache_size distinct values
+    """
+
+    def __init__(self, pairs, cache_size=4096):
+        self.pairs = tuple((old, new) for old, new in pairs if old != new)
+        if any(not old for old, _ in self.pairs):
+            raise ValueError('replacement keys must not be empty')
+        # for each key, the indexes to try when the scan reports it: its own
+        # and those of the keys an occurrence of it can hide from the scan
+        self._tried = {}
+        for old, _ in self.pairs:
+            if old not in self._tried:
+                self._tried[old] = tuple(i for i, (other, _) in enumerate(self.pairs)
+                                         if other == old or _overlaps(old, other))
+        self._scanners = {}
+        self.apply = functools.lru_cache(maxsize=cache_size)(self._apply)
+
+    def _scanner(self, start):
+        """ a regex matching the keys of pairs[start:], longest first """
+        if start not in self._scanners:
+            keys = {old for old, _ in self.pairs[start:]}
+            self._scanners[start] = re.compile(_trie_pattern(keys)) if keys else None
+        return self._scanners[start]
+
+    def _candidates(self, value, start):
+        """ return the sorted indexes >= start of pairs whose key may be in value """
+        scanner = self._scanner(start)
+        if scanner is None:
+            return ()
+        found = scanner.findall(value)
+        if not found:
+            return ()
+        tried = self._tried
+        if len(found) == 1:
+            indexes = tried[found[0]]
+        else:
+            indexes = sorted(set().union(*(tried[old] for old in set(found))))
+        return [i for i in indexes if i >= start] if start else indexes
+
+    def _apply(self, value):
+        """ return value with every replacement applied in order """
+        pairs = self.pairs
+        candidates = self._candidates(value, 0)
+        position = 0
+        while position < len(candidates):
+            i = candidates[position]
+            old, new = pairs[i]
+            position += 1
+            if old in value:
+                value = value.replace(old, new)
+                candidates = self._candidates(value, i + 1)
+                position = 0
+        return value
+
+    def __call__(self, value):
+        return self.apply(value)
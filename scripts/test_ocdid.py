@@ -1,5 +1,8 @@
 import ocdid
+import random
 import unittest
+from operator import itemgetter
+from fuzzywuzzy import process
 
 test_ocdids = [
     ('ocd-division/country:us/court_of_appeals:10/district_court:colorado',True),
@@ -14,6 +17,13 @@ test_match_name = [
     ('ocd-division/country:us/state:al','county','3',(None, -1))
     ]
 
+test_match_names = [
+    ('ocd-division/country:us/state:sd/county:beadle','place','belle_prairie',('ocd-division/country:us/state:sd/county:beadle/place:belle_prairie', 100)),
+    ('ocd-division/country:us/state:al','county','marion',('ocd-division/country:us/state:al/county:marion', 100)),
+    ('ocd-division/country:us/state:al','county','marion',('ocd-division/country:us/state:al/county:marion', 100)),
+    ('ocd-division/country:us/state:al','county','3',('ocd-division/country:us/state:al/county:autauga', 0))
+    ]
+
 test_match_type = [
     ('ocd-division/country:us/state:sd/place:sioux_falls','council',5,'council_district'),
     ('ocd-division/country:us/state:al','county',67,'county'),
@@ -43,10 +53,34 @@ class TestOcdid(unittest.TestCase):
         for test_id,is_valid in test_ocdids:
             self.assertEqual(is_valid, ocdid.is_ocdid(test_id))
 
+    def testGetException(self):
+        # rows of corrections/country-us.csv map an incorrect id to the official one
+        incorrect = 'ocd-division/country:us/state:or/place:st._helens'
+        self.assertTrue(ocdid.is_exception(incorrect))
+        self.assertEqual('ocd-division/country:us/state:or/place:st_helens', ocdid.get_exception(incorrect))
+        self.assertEqual(None, ocdid.get_exception('ocd-division/country:us/state:or/place:st_helens'))
+
     def testMatchName(self):
         for prefix,dist_type,dist_name,result in test_match_name:
             self.assertEqual(result, ocdid.match_name(prefix,dist_type,dist_name))
 
+    def testMatchNames(self):
+        rows = [(prefix,dist_type,dist_name) for prefix,dist_type,dist_name,result in test_match_names]
+        self.assertEqual([result for prefix,dist_type,dist_name,result in test_match_names], ocdid.match_names(rows))
+
+    def testMatchNamesMatchesMatchName(self):
+        # batches must score every name exactly as match_name does, typos included
+        rng = random.Random(0)
+        districts = sorted((prefix,dist_type,dist_names)
+                           for prefix,district in ocdid.get_data().ocdids.items()
+                           for dist_type,dist_names in district.items())
+        rows = []
+        for prefix,dist_type,dist_names in rng.sample(districts,50):
+            for dist_name in rng.sample(dist_names,min(4,len(dist_names))):
+                i = rng.randrange(len(dist_name))
+                rows.append((prefix,dist_type,dist_name[:i] + dist_name[i+1:]))
+        self.assertEqual([ocdid.match_name(*row) for row in rows], ocdid.match_names(rows))
+
     def testMatchType(self):
         for prefix,dist_type,dist_len,result in test_match_type:
             self.assertEqual(result, ocdid.match_type(prefix,dist_type,dist_len))
@@ -61,5 +95,32 @@ class TestOcdid(unittest.TestCase):
         for dist_type,dist_name,match_count in test_type_name_search:
             self.assertEqual(match_count, len(ocdid.type_name_search(dist_type,dist_name)))
 
+    def testSearchMatchesFullScan(self):
+        # the trigram index must give what scanning every list of names does
+        for name,match_count in test_name_search:
+            match_list = []
+            for prefix,district in ocdid.get_data().ocdids.items():
+                for dist_type,dist_names in district.items():
+                    match_vals = process.extractOne(name,dist_names)
+                    if match_vals and match_vals[1] > ocdid.MATCH_RATIO:
+                        match_list.append((match_vals[1],'{}/{}:{}'.format(prefix,dist_type,match_vals[0])))
+            match_list = sorted(match_list,key=itemgetter(0))
+            match_list.reverse()
+            self.assertEqual(match_list[:ocdid.MATCH_LIMIT], ocdid.name_search(name))
+
+    def testResultCache(self):
+        hits = ocdid.cache_info().get('name_search',{}).get('hits',0)
+        self.assertEqual(ocdid.name_search('marion'), ocdid.name_search('marion'))
+        self.assertEqual(hits + 1, ocdid.cache_info()['name_search']['hits'])
+
+    def testLRUCacheEvicts(self):
+        cache = ocdid.LRUCache(2)
+        cache.put('a',1)
+        cache.put('b',2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c',3)
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual({'size':2,'maxsize':2,'hits':1,'misses':1,'evictions':1}, cache.stats())
+
 if __name__ == '__main__':
     unittest.main()
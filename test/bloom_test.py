@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import os
+import unittest
+from unittest import mock
+
+from compiled_country import CompiledCountryTestCase  # also puts scripts/ on sys.path
+import bloom
+import normalize_ids
+
+
+class TestBloom(CompiledCountryTestCase):
+
+  OUTPUTS = {'bloom_filter': True}
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.bloom_file = cls.output_path('.bloom')
+    cls.table_file = cls.output_path('.idtable')
+    cls.ids = [id_ for id_, in cls.result.records.sorted_rows(['id'])]
+
+  def test_no_false_negatives(self):
+    with bloom.BloomFilter(self.bloom_file) as bloom_filter:
+      self.assertEqual(len(bloom_filter), len(self.ids))
+      for id_ in self.ids:
+        self.assertTrue(bloom_filter.might_contain(id_))
+
+  def test_false_positive_rate(self):
+    absent = ['{}/extra:{}'.format(id_, i) for i, id_ in enumerate(self.ids)]
+    with bloom.BloomFilter(self.bloom_file) as bloom_filter:
+      hits = sum(1 for id_ in absent if id_ in bloom_filter)
+    self.assertLess(hits / len(absent), 0.03)
+    self.assertLess(os.path.getsize(self.bloom_file), 2 * len(self.ids) + 64)
+
+  def test_membership_is_exact(self):
+    with bloom.IdMembership(self.bloom_file, self.table_file) as ids:
+      self.assertEqual(len(ids), len(self.ids))
+      for id_ in self.ids:
+        self.assertIn(id_, ids)
+        self.assertNotIn(id_ + '/extra:1', ids)
+
+  def test_empty_filter(self):
+    path = os.path.join(self.tmpdir.name, 'empty.bloom')
+    bloom.write_bloom(path, [])
+    with bloom.BloomFilter(path) as bloom_filter:
+      self.assertEqual(len(bloom_filter), 0)
+      self.assertFalse(bloom_filter.might_contain('ocd-division/country:ca'))
+
+
+class TestNormalizerUsesBloom(CompiledCountryTestCase):
+
+  OUTPUTS = {'canonical': True, 'bloom_filter': True}
+
+  def test_compiled_filter_is_consulted(self):
+    might_contain = mock.patch.object(bloom.BloomFilter, 'might_contain', autospec=True,
+                                      side_effect=bloom.BloomFilter.might_contain)
+    normalizer = normalize_ids.Normalizer(self.identifiers, os.path.join(self.tmpdir.name, 'corrections'))
+    with might_contain as consulted, normalizer:
+      self.assertEqual(normalizer.normalize('ocd-division/country:ca/province:on'),
+                       ('ocd-division/country:ca/province:on', normalize_ids.OK))
+      self.assertEqual(normalizer.normalize('ocd-division/country:ca/province:zz')[1], normalize_ids.UNKNOWN)
+    self.assertEqual(consulted.call_count, 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import unittest
+
+from compiled_country import CompiledCountryTestCase  # also puts scripts/ on sys.path
+import canonical_index
+
+
+class TestCanonicalMap(unittest.TestCase):
+
+  def test_chains_resolve_to_the_end(self):
+    same_as = {'a': 'b', 'b': 'c', 'd': 'c', 'e': 'b'}
+    self.assertEqual(canonical_index.canonical_map(same_as), {'a': 'c', 'b': 'c', 'd': 'c', 'e': 'c'})
+
+  def test_cycle_raises(self):
+    with self.assertRaisesRegex(ValueError, 'b -> c -> b'):
+      canonical_index.canonical_map({'a': 'b', 'b': 'c', 'c': 'b'})
+    with self.assertRaises(ValueError):
+      canonical_index.canonical_map({'a': 'a'})
+
+
+class TestCanonicalIndex(CompiledCountryTestCase):
+
+  OUTPUTS = {'canonical': True}
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.path = cls.output_path('.canonical.idtable')
+    cls.same_as = dict((id_, same_as) for id_, same_as in cls.result.records.field_values('sameAs') if same_as)
+
+  def test_every_id_resolves(self):
+    self.assertTrue(self.same_as)
+    ids = [row[0] for row in self.result.records.sorted_rows(['id'])]
+    with canonical_index.CanonicalIndex(self.path) as index:
+      self.assertEqual(len(index), len(ids))
+      for id_ in ids:
+        self.assertEqual(index.canonicalize(id_), self.same_as.get(id_, id_))
+      self.assertIsNone(index.canonicalize('ocd-division/country:ca/no:such'))
+
+  def test_canonicalize_many_streams(self):
+    aliases = sorted(self.same_as)
+    ids = aliases + ['ocd-division/country:ca', 'ocd-division/country:ca/no:such']
+    with canonical_index.CanonicalIndex(self.path) as index:
+      results = index.canonicalize_many(iter(ids))
+      self.assertEqual(next(results), self.same_as[aliases[0]])
+      self.assertEqual(list(results), [self.same_as[a] for a in aliases[1:]] + ['ocd-division/country:ca', None])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import io
+import os
+import sys
+import types
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'country-us'))
+try:
+  import us  # noqa: F401
+except ImportError:
+  # census_places only uses the us package to name states for the SLD
+  # files, which these tests don't write, so an empty stand-in will do
+  sys.modules['us'] = types.ModuleType('us')
+import census_places  # noqa: E402
+
+URL = 'http://www2.census.gov/geo/gazetteer/2014_Gazetteer/2014_Gaz_counties_national.zip'
+
+
+class FailingResponse(io.BytesIO):
+  """ a response that breaks off after its first chunk """
+
+  def read(self, size=-1):
+    if self.tell():
+      raise ConnectionResetError('connection reset')
+    return super().read(size)
+
+
+class TestFetchGazZip(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.cache_dir = os.path.join(self.tmpdir.name, 'cache')
+    self.offline_dir = os.path.join(self.tmpdir.name, 'offline')
+    os.makedirs(self.offline_dir)
+    print_patch = mock.patch('builtins.print')
+    print_patch.start()
+    self.addCleanup(print_patch.stop)
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def urlopen(self, content):
+    return mock.patch('urllib.request.urlopen', side_effect=lambda url: io.BytesIO(content))
+
+  def cache_files(self):
+    return sorted(os.listdir(self.cache_dir))
+
+  def test_download_is_cached(self):
+    with self.urlopen(b'zip one') as urlopen:
+      path = census_places.fetch_gaz_zip(URL, self.cache_dir)
+      self.assertEqual(census_places.fetch_gaz_zip(URL, self.cache_dir), path)
+    self.assertEqual(urlopen.call_count, 1)
+    with open(path, 'rb') as fh:
+      self.assertEqual(fh.read(), b'zip one')
+    self.assertEqual(self.cache_files(), [os.path.basename(path), 'urls'])
+
+  def test_each_url_has_its_own_entry(self):
+    with self.urlopen(b'zip one'):
+      one = census_places.fetch_gaz_zip(URL, self.cache_dir)
+    with self.urlopen(b'zip two'):
+      two = census_places.fetch_gaz_zip(URL.replace('counties', 'place'), self.cache_dir)
+    self.assertNotEqual(one, two)
+    self.assertEqual(len(os.listdir(os.path.join(self.cache_dir, 'urls'))), 2)
+    with self.urlopen(b'unused') as urlopen:
+      self.assertEqual(census_places.fetch_gaz_zip(URL, self.cache_dir), one)
+    urlopen.assert_not_called()
+
+  def test_damaged_zip_is_downloaded_again(self):
+    with self.urlopen(b'zip one'):
+      path = census_places.fetch_gaz_zip(URL, self.cache_dir)
+    with open(path, 'wb') as fh:
+      fh.write(b'truncated')
+    with self.urlopen(b'zip one') as urlopen:
+      self.assertEqual(census_places.fetch_gaz_zip(URL, self.cache_dir), path)
+    self.assertEqual(urlopen.call_count, 1)
+    with open(path, 'rb') as fh:
+      self.assertEqual(fh.read(), b'zip one')
+
+  def test_failed_download_leaves_nothing(self):
+    failing = mock.patch('urllib.request.urlopen', side_effect=lambda url: FailingResponse(b'x' * (2 << 20)))
+    with failing, self.assertRaises(ConnectionResetError):
+      census_places.fetch_gaz_zip(URL, self.cache_dir)
+    self.assertEqual(self.cache_files(), ['urls'])
+    self.assertEqual(os.listdir(os.path.join(self.cache_dir, 'urls')), [])
+
+  def test_offline_dir_is_used_first(self):
+    path = os.path.join(self.offline_dir, '2014_Gaz_counties_national.zip')
+    with open(path, 'wb') as fh:
+      fh.write(b'local zip')
+    with self.urlopen(b'unused') as urlopen:
+      self.assertEqual(census_places.fetch_gaz_zip(URL, self.cache_dir, self.offline_dir), path)
+    urlopen.assert_not_called()
+
+  def test_offline_falls_back_to_the_cache(self):
+    with self.urlopen(b'zip one'):
+      path = census_places.fetch_gaz_zip(URL, self.cache_dir)
+    with self.urlopen(b'unused') as urlopen:
+      self.assertEqual(census_places.fetch_gaz_zip(URL, self.cache_dir, self.offline_dir), path)
+      with self.assertRaises(FileNotFoundError):
+        census_places.fetch_gaz_zip(URL.replace('counties', 'place'), self.cache_dir, self.offline_dir)
+    urlopen.assert_not_called()
+
+
+class TestOpenGazZip(unittest.TestCase):
+
+  def test_rows_are_read_from_the_archive(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = os.path.join(tmpdir, '2014_Gaz_counties_national.zip')
+      with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('2014_Gaz_counties_national.txt',
+                    'USPS\tGEOID\tNAME\nAL\t01001\tAutauga County\nPR\t72001\tAdjuntas Municipio\xf1\n'
+                    .encode('latin1'))
+      with mock.patch.object(census_places, 'fetch_gaz_zip', return_value=path) as fetch:
+        rows = list(census_places.open_gaz_zip(URL))
+    fetch.assert_called_once_with(URL)
+    self.assertEqual(rows, [{'USPS': 'AL', 'GEOID': '01001', 'NAME': 'Autauga County'},
+                            {'USPS': 'PR', 'GEOID': '72001', 'NAME': 'Adjuntas Municipio\xf1'}])
+
+
+GAZETTEERS = {
+    'county': ['USPS\tGEOID\tNAME',
+               'MI\t26001\tAlcona County',
+               'MI\t26003\tAlger County',
+               'CT\t09001\tFairfield County'],
+    'place': ['USPS\tGEOID\tNAME\tFUNCSTAT',
+              'MI\t2638040\tHarrisville city\tA',
+              'MI\t2699999\tNowhere city\tF',
+              'CT\t0901220\tAnsonia city\tA'],
+    'subdiv': ['USPS\tGEOID\tNAME\tFUNCSTAT',
+               'MI\t2600101000\tAlcona township\tA',
+               'MI\t2600302000\tAlcona township\tA',
+               'CT\t0900104720\tBethel town\tA'],
+}
+
+
+class TestProcessTypes(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    offline_dir = os.path.join(self.tmpdir.name, 'offline')
+    os.makedirs(offline_dir)
+    for entity_type, lines in GAZETTEERS.items():
+      name = census_places.TYPES[entity_type]['zip']
+      with zipfile.ZipFile(os.path.join(offline_dir, name), 'w') as zf:
+        zf.writestr(name.replace('.zip', '.txt'), '\n'.join(lines) + '\n')
+    os.makedirs(os.path.join(self.tmpdir.name, 'identifiers', 'country-us', 'census_autogenerated'))
+    # workers are forked, so they see the patched module too
+    for patch in (mock.patch.object(census_places, 'OFFLINE_DIR', offline_dir), mock.patch('builtins.print')):
+      patch.start()
+      self.addCleanup(patch.stop)
+    cwd = os.getcwd()
+    os.chdir(self.tmpdir.name)
+    self.addCleanup(os.chdir, cwd)
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def process(self, jobs):
+    census_places.process_types(('county', 'place', 'subdiv'), jobs=jobs)
+    with open('identifiers/country-us/census_autogenerated/us_census_places.csv') as fh:
+      return fh.read()
+
+  def test_subdivisions_find_their_county_by_geoid(self):
+    rows = self.process(jobs=1).splitlines()
+    self.assertEqual(rows, [
+        'id,name,census_geoid_14',
+        'ocd-division/country:us/state:ct/county:fairfield,Fairfield County,place-09001',
+        'ocd-division/country:us/state:ct/place:ansonia,Ansonia city,place-0901220',
+        'ocd-division/country:us/state:ct/place:bethel,Bethel town,place-0900104720',
+        'ocd-division/country:us/state:mi/county:alcona,Alcona County,place-26001',
+        'ocd-division/country:us/state:mi/county:alcona/place:alcona,Alcona township,place-2600101000',
+        'ocd-division/country:us/state:mi/county:alger,Alger County,place-26003',
+        'ocd-division/country:us/state:mi/county:alger/place:alcona,Alcona township,place-2600302000',
+        'ocd-division/country:us/state:mi/place:harrisville,Harrisville city,place-2638040',
+    ])
+
+  def test_parallel_output_matches_serial(self):
+    self.assertEqual(self.process(jobs=3), self.process(jobs=1))
+
+  def test_missing_county_is_an_error(self):
+    with mock.patch.object(census_places, 'COUNTY_GEOID_LENGTH', 4):
+      with self.assertRaisesRegex(Exception, 'had no parent county'):
+        self.process(jobs=1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import gc
+import os
+import sys
+import tempfile
+import unittest
+import warnings
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import compile  # noqa: E402
+import division_id  # noqa: E402
+
+
+def write_source(root, country, filename, text, mode='w'):
+  path = os.path.join(root, 'identifiers', 'country-{}'.format(country), filename)
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  with open(path, mode) as fh:
+    fh.write(text)
+  return path
+
+
+class CompileTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.root = self.tmpdir.name
+    write_source(self.root, 'xa', 'country.csv',
+                 'id,name\nocd-division/country:xa,Xa\nocd-division/country:xa/state:one,One\n')
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+
+class TestCompileCountry(CompileTestCase):
+
+  def test_blank_id_is_an_error(self):
+    write_source(self.root, 'xa', 'more.csv', 'id,name\n,Nameless\nocd-division/country:xa/state:two,Two\n')
+    result = compile.compile_country('xa', root=self.root)
+    self.assertEqual([error.kind for error in result.errors], ['missing_id'])
+    self.assertIn('ocd-division/country:xa/state:two', result.records)
+
+  def test_source_files_are_closed(self):
+    write_source(self.root, 'xa', 'more.csv', 'id,name\nocd-division/country:xa/state:two,Two\n')
+    with warnings.catch_warnings(record=True) as caught:
+      warnings.simplefilter('always', ResourceWarning)
+      compile.compile_country('xa', root=self.root)
+      gc.collect()
+    self.assertEqual([str(warning.message) for warning in caught if warning.category is ResourceWarning], [])
+
+  def test_ids_are_parsed_once(self):
+    parsed = []
+
+    def parse_id(id_):
+      parsed.append(id_)
+      return division_id.parse_id(id_)
+
+    with mock.patch.dict(compile.FIELD_VALIDATORS, {'id': parse_id}), mock.patch.object(compile, 'parse_id', parse_id):
+      result = compile.compile_country('xa', root=self.root)
+    self.assertEqual(sorted(parsed), sorted(result.records))
+    self.assertEqual(result.types, {'country': 1, 'state': 1})
+
+  def test_records_is_a_mapping(self):
+    records = compile.compile_country('xa', root=self.root).records
+    self.assertEqual(dict(records.items()), {
+        'ocd-division/country:xa': {'id': 'ocd-division/country:xa', 'name': 'Xa'},
+        'ocd-division/country:xa/state:one': {'id': 'ocd-division/country:xa/state:one', 'name': 'One'}})
+    self.assertEqual(list(records.values()), [records[id_] for id_ in records])
+    self.assertEqual(sorted(records.field_values('name')),
+                     [('ocd-division/country:xa', 'Xa'), ('ocd-division/country:xa/state:one', 'One')])
+
+
+class TestCompileAll(CompileTestCase):
+
+  def test_one_failing_country_keeps_the_rest(self):
+    # bytes that aren't UTF-8 make reading the source raise
+    write_source(self.root, 'xb', 'country.csv', b'id,name\nocd-division/country:xb,\xff\n', mode='wb')
+    cwd = os.getcwd()
+    os.chdir(self.root)
+    try:
+      results = compile.compile_all(['xa', 'xb'], jobs=1)
+    finally:
+      os.chdir(cwd)
+    self.assertEqual([country for country, _, _ in results], ['xa', 'xb'])
+    self.assertEqual(results[0][2], [])
+    self.assertTrue(os.path.exists(os.path.join(self.root, 'identifiers', 'country-xa.csv')))
+    [error] = results[1][2]
+    self.assertEqual(error.kind, 'unexpected_error')
+    self.assertIn('UnicodeDecodeError', error.message)
+
+
+class TestCheckCsv(CompileTestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.result = compile.compile_country('xa', root=self.root)
+    self.path = os.path.join(self.root, 'country-xa.csv')
+
+  def check(self, text):
+    with open(self.path, 'w', encoding='UTF-8') as fh:
+      fh.write(text)
+    return compile.check_csv(self.result, self.path)
+
+  def test_same_file_matches(self):
+    compile.write_csv(self.result, self.path)
+    check = compile.check_csv(self.result, self.path)
+    self.assertEqual((check.matches, check.rows, check.id), (True, 2, None))
+    self.assertEqual(compile.check_errors(self.result, self.path), [])
+
+  def test_first_differing_id(self):
+    check = self.check('id,name\nocd-division/country:xa,Xa\nocd-division/country:xa/state:one,Uno\n')
+    self.assertEqual((check.matches, check.rows, check.id), (False, 1, 'ocd-division/country:xa/state:one'))
+    [error] = compile.check_errors(self.result, self.path)
+    self.assertEqual((error.kind, error.id), ('check_mismatch', 'ocd-division/country:xa/state:one'))
+
+  def test_extra_trailing_rows(self):
+    check = self.check('id,name\nocd-division/country:xa,Xa\nocd-division/country:xa/state:one,One\n'
+                       'ocd-division/country:xa/state:two,Two\n')
+    self.assertEqual((check.matches, check.rows, check.id), (False, 2, 'ocd-division/country:xa/state:two'))
+    self.assertEqual(len(compile.check_errors(self.result, self.path)), 1)
+
+  def test_different_header(self):
+    check = self.check('id,name,sameAs\nocd-division/country:xa,Xa,\nocd-division/country:xa/state:one,One,\n')
+    self.assertEqual((check.matches, check.rows, check.id), (False, 0, None))
+    [error] = compile.check_errors(self.result, self.path)
+    self.assertIn('different header', error.message)
+
+  def test_other_row_order_is_accepted(self):
+    check = self.check('id,name\r\nocd-division/country:xa/state:one,One\r\nocd-division/country:xa,Xa\r\n')
+    self.assertFalse(check.matches)
+    self.assertEqual(compile.check_errors(self.result, self.path), [])
+
+
+class TestSourceCache(CompileTestCase):
+
+  def compile(self):
+    return compile.compile_country('xa', root=self.root, cache_dir=os.path.join(self.root, 'cache'))
+
+  def test_cache_hit_gives_the_same_result(self):
+    cold = self.compile()
+    with mock.patch.object(compile, 'open_csv', side_effect=AssertionError('parsed a cached file')):
+      warm = self.compile()
+    self.assertEqual(warm.errors, [])
+    self.assertEqual(warm.field_order, cold.field_order)
+    self.assertEqual(list(warm.sorted_rows()), list(cold.sorted_rows()))
+
+  def test_edited_file_is_read_again(self):
+    self.compile()
+    write_source(self.root, 'xa', 'country.csv',
+                 'id,name\nocd-division/country:xa,Xa\nocd-division/country:xa/state:one,Uno\n')
+    result = self.compile()
+    self.assertEqual(result.records['ocd-division/country:xa/state:one']['name'], 'Uno')
+
+
+class TestPhaseTimer(unittest.TestCase):
+
+  def test_rss_growth_is_charged_to_the_phase_that_raised_the_peak(self):
+    timer = compile.PhaseTimer()
+    # the process's peak RSS before and after each phase, then for report()
+    with mock.patch.object(compile, '_peak_rss_mb', side_effect=[100.0, 150.0, 150.0, 150.0, 150.0, 160.0, 160.0]):
+      with timer.phase('merge'):
+        pass
+      with timer.phase('unique'):
+        pass
+      with timer.phase('merge'):
+        pass
+      report = timer.report()
+    self.assertEqual(report['peak_rss_mb'], 160.0)
+    self.assertEqual({name: phase['peak_rss_growth_mb'] for name, phase in report['phases'].items()},
+                     {'merge': 60.0, 'unique': 0.0})
+
+  def test_rss_is_left_out_when_unknown(self):
+    timer = compile.PhaseTimer()
+    with mock.patch.object(compile, '_peak_rss_mb', return_value=None):
+      with timer.phase('merge'):
+        pass
+      report = timer.report()
+    self.assertIsNone(report['peak_rss_mb'])
+    self.assertIsNone(report['phases']['merge']['peak_rss_growth_mb'])
+
+
+if __name__ == '__main__':
+  unittest.main()
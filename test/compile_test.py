@@ -3,12 +3,15 @@
 # Run this test from the root of the repository, as:
 # $ bazel test :all --test_output=errors
 
-import difflib
+import io
+import csv
 import os
-import re
-import subprocess
+import sys
 import unittest
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import compile  # noqa: E402
+
 
 def sort_csv_lines(csv_text):
   """Sorts the rows of a csv text, except for the header row.
@@ -32,7 +35,7 @@ class TestSourcesMatchCommittedCSV(unittest.TestCase):
   the compiler for your country, and commit the result.
   """
 
-  def get_committed_and_compiled_data(self, country_code):
+  def get_committed_and_compiled_data(self, country_code, result=None):
     # Read what's in the repo.
     committed_csv_path = F'identifiers/country-{country_code}.csv'
     try:
@@ -43,30 +46,29 @@ class TestSourcesMatchCommittedCSV(unittest.TestCase):
       # empty string.
       committed_csv = ''
 
-    # Run the compiler with temp output.
-    compiler_output_path = os.path.join(os.getenv('TEST_TMPDIR'), F"out-{country_code}.csv")
-    subprocess.run([
-        './scripts/compile.py', F'--output_csv={compiler_output_path}', country_code
-    ], check=True)
-
-    # Read the output of the compiler.
-    with open(compiler_output_path, 'r', encoding='UTF-8') as compiler_output_file:
-      compiler_output = compiler_output_file.read()
+    # Run the compiler in-process and render its output without touching disk.
+    if result is None:
+      result = compile.compile_country(country_code)
+    self.assertEqual(result.errors, [], compile.format_errors(result.errors))
+    compiler_output = io.StringIO()
+    writer = csv.writer(compiler_output)
+    writer.writerow(result.field_order)
+    writer.writerows(result.sorted_rows())
 
-    return committed_csv, compiler_output
+    return committed_csv, compiler_output.getvalue()
 
   def test_all_countries(self):
-    _, csv_source_dirs, _ = list(os.walk('identifiers'))[0]
     mismatches = []
-    for dirname in csv_source_dirs:
-      # Ignore any files that don't match the expected pattern.
-      m = re.match(r'country-(..)', dirname)
-      if m:
-        country_code = m.group(1)
-        committed_csv, compiler_output = self.get_committed_and_compiled_data(
-            country_code)
-        if sort_csv_lines(committed_csv) != sort_csv_lines(compiler_output):
-          mismatches.append(country_code)
+    for country_code in compile.list_countries():
+      # Stream the compiled rows against the committed file first; only when
+      # the order or line endings differ are both read for a sorted compare.
+      result = compile.compile_country(country_code)
+      if not result.errors and compile.check_csv(result, F'identifiers/country-{country_code}.csv').matches:
+        continue
+      committed_csv, compiler_output = self.get_committed_and_compiled_data(
+          country_code, result)
+      if sort_csv_lines(committed_csv) != sort_csv_lines(compiler_output):
+        mismatches.append(country_code)
     # Rather than assert as we go, which would bail out on the first failure, we
     # compile a list of all the mismatching countries, and print a message that
     # summarizes what to do.
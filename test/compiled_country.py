@@ -0,0 +1,52 @@
+"""
+Shared fixture for tests of the files compile.py writes next to a compiled CSV.
+
+A test case subclasses CompiledCountryTestCase and names the outputs it
+checks in OUTPUTS, as write_outputs' keyword arguments.  The country is
+compiled once per test run and written, with those outputs, to
+identifiers/ under a temporary directory for each test class.
+"""
+import os
+import sys
+import functools
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import compile  # noqa: E402
+
+
+@functools.lru_cache(maxsize=None)
+def compiled(country):
+  """ compile_country(country), compiled once however many tests use it """
+  return compile.compile_country(country)
+
+
+class CompiledCountryTestCase(unittest.TestCase):
+
+  COUNTRY = 'ca'
+  OUTPUTS = {}
+
+  @classmethod
+  def setUpClass(cls):
+    cls.tmpdir = tempfile.TemporaryDirectory()
+    cls.identifiers = os.path.join(cls.tmpdir.name, 'identifiers')
+    os.makedirs(cls.identifiers)
+    cls.result = compiled(cls.COUNTRY)
+    cls.output_file = cls.write_country(cls.COUNTRY, **cls.OUTPUTS)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.tmpdir.cleanup()
+
+  @classmethod
+  def write_country(cls, country, **outputs):
+    """ write another country to identifiers/ with write_outputs, returning its CSV's path """
+    output_file = os.path.join(cls.identifiers, 'country-{}.csv'.format(country))
+    compile.write_outputs(compiled(country), output_file, **outputs)
+    return output_file
+
+  @classmethod
+  def output_path(cls, suffix):
+    """ the path of the output written next to the CSV with suffix, e.g. '.bloom' """
+    return os.path.splitext(cls.output_file)[0] + suffix
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import os
+import random
+import re
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import division_id  # noqa: E402
+
+# The regular expression compile.py validated ids with before division_id.
+REFERENCE_REGEX = re.compile(
+    r'^ocd-division/(country|region):[a-z]{2}(/[^\W\d]+[-]?[^\W\d]+:[\w.~-]+)*$', re.U)
+
+
+def reference_valid(id_):
+  # '$' also matches before a trailing newline, which the parser rejects.
+  return bool(REFERENCE_REGEX.match(id_) and id_.lower() == id_ and
+              not id_.endswith('\n'))
+
+
+class TestParseId(unittest.TestCase):
+
+  def test_parse(self):
+    parsed = division_id.parse_id(
+        'ocd-division/country:us/state:ny/place:new_york')
+    self.assertEqual(parsed.country, 'us')
+    self.assertEqual(parsed.parts, (('country', 'us'), ('state', 'ny'),
+                                    ('place', 'new_york')))
+    self.assertEqual(parsed.parent, 'ocd-division/country:us/state:ny')
+    self.assertEqual(parsed.type, 'place')
+    self.assertEqual(parsed.value, 'new_york')
+
+    parsed = division_id.parse_id('ocd-division/region:eu')
+    self.assertEqual(parsed.country, 'eu')
+    self.assertIsNone(parsed.parent)
+    self.assertEqual(parsed.type, 'region')
+
+  def test_invalid(self):
+    for id_ in ['', 'ocd-division', 'ocd-division/country:usa',
+                'ocd-division/state:us', 'ocd-division/country:us/',
+                'ocd-division/country:us/state', 'ocd-division/country:us/s:ny',
+                'ocd-division/country:us/-st:ny', 'ocd-division/country:us/st-:ny',
+                'ocd-division/country:us/s--t:ny', 'ocd-division/country:us/st:n:y',
+                'ocd-division/country:us/state:NY', 'ocd-division/country:us/st4te:ny',
+                'ocd-division/country:us/state:ny/', 'ocd-division/country:us\n']:
+      with self.assertRaises(ValueError, msg=repr(id_)):
+        division_id.parse_id(id_)
+
+  def test_fuzz_against_regex(self):
+    rng = random.Random(2)
+    alphabet = 'ab_-:/.~09Aé²٣ '
+    valid_pieces = ['/state:ny', '/place:a.b~c-d', '/sch-ool:x', '/c_d:1',
+                    '/cd:', '/c:d', '/state:NY', '/-ab:c', '/ab-:c']
+    for _ in range(20000):
+      id_ = 'ocd-division/' + rng.choice(['country:us', 'region:eu', 'country:u'])
+      for _ in range(rng.randrange(4)):
+        if rng.random() < 0.6:
+          id_ += rng.choice(valid_pieces)
+        else:
+          id_ += ''.join(rng.choice(alphabet) for _ in range(rng.randrange(8)))
+      try:
+        division_id.parse_id(id_)
+        valid = True
+      except ValueError:
+        valid = False
+      self.assertEqual(reference_valid(id_), valid, repr(id_))
+
+  def test_adversarial_ids_are_linear(self):
+    # Long type segments that almost match made the old regex backtrack.
+    for id_ in ['ocd-division/country:us/' + 'a' * 100000 + '-',
+                'ocd-division/country:us/' + 'ab-' * 50000 + ':x',
+                'ocd-division/country:us' + '/ab:c' * 20000 + '/ab',
+                'ocd-division/country:us/' + 'a' * 100000 + ':b' * 1000]:
+      start = time.perf_counter()
+      with self.assertRaises(ValueError):
+        division_id.parse_id(id_)
+      self.assertLess(time.perf_counter() - start, 0.5)
+
+
+
+class TestSlugify(unittest.TestCase):
+
+  def test_slugify(self):
+    self.assertEqual(division_id.slugify('St. Paul'), 'st_paul')
+    self.assertEqual(division_id.slugify('Winston-Salem'), 'winston-salem')
+    self.assertEqual(division_id.slugify("Coeur d'Alene"), 'coeur_d~alene')
+    self.assertEqual(division_id.slugify('Doña Ana'), 'doña_ana')
+    self.assertEqual(division_id.slugify('Belknap (1/2)'), 'belknap_~1~2~')
+
+  def test_every_invalid_character_is_replaced(self):
+    # more than 32, which re.UNICODE passed as a count used to stop at
+    self.assertEqual(division_id.slugify('!' * 40), '~' * 40)
+
+  def test_slugify_many(self):
+    names = ['Oak Park', 'Oak Park', 'Elm']
+    self.assertEqual(division_id.slugify_many(names), ['oak_park', 'oak_park', 'elm'])
+    self.assertEqual(division_id.slugify_many(iter(names)), ['oak_park', 'oak_park', 'elm'])
+
+  def test_make_id(self):
+    make_id = division_id.make_id
+    self.assertEqual(make_id('ocd-division/country:us/state:mn', 'place', 'St. Anthony'),
+                     'ocd-division/country:us/state:mn/place:st_anthony')
+    division_id.validate_id(make_id('ocd-division/country:uk', 'eer', 'North East'))
+    with self.assertRaises(ValueError):
+      make_id('ocd-division/country:us', 'State', 'ny')
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import unittest
+
+from compiled_country import CompiledCountryTestCase  # also puts scripts/ on sys.path
+import compile
+import divisions_db
+
+
+class TestDivisionsDB(CompiledCountryTestCase):
+
+  OUTPUTS = {'sqlite': True}
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.db = divisions_db.DivisionsDB(cls.output_path('.sqlite'))
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.db.close()
+    super().tearDownClass()
+
+  def test_get_matches_compiled_records(self):
+    for id_ in list(self.result.records)[:200]:
+      record = dict(self.result.records[id_])
+      parsed = compile.parse_id(id_)
+      record['type'] = parsed.type
+      if parsed.parent:
+        record['parent'] = parsed.parent
+      self.assertEqual(self.db.get(id_), record)
+    self.assertIsNone(self.db.get('ocd-division/country:ca/province:zz'))
+
+  def test_children(self):
+    provinces = self.db.children('ocd-division/country:ca', type_='province')
+    self.assertEqual(len(provinces), 10)
+    self.assertIn('ocd-division/country:ca/province:on', [p['id'] for p in provinces])
+
+  def test_find_unique_field(self):
+    records = self.db.find('sgc', '35')
+    self.assertEqual([r['id'] for r in records], ['ocd-division/country:ca/province:on'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import compile  # noqa: E402
+import generate_synthetic  # noqa: E402
+
+
+def read_tree(root):
+  contents = {}
+  for dirpath, dirnames, files in os.walk(root):
+    for f in files:
+      path = os.path.join(dirpath, f)
+      with open(path, encoding='UTF-8') as fh:
+        contents[os.path.relpath(path, root)] = fh.read()
+  return contents
+
+
+class TestGenerateSynthetic(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def generate(self, name, **kwargs):
+    root = os.path.join(self.tmpdir.name, name)
+    counts = generate_synthetic.Generator(root, divisions=5000, states=5, **kwargs).generate()
+    return root, counts
+
+  def test_deterministic(self):
+    first, _ = self.generate('first', seed=7)
+    second, _ = self.generate('second', seed=7)
+    other, _ = self.generate('other', seed=8)
+    self.assertEqual(read_tree(first), read_tree(second))
+    self.assertNotEqual(read_tree(first), read_tree(other))
+
+  def test_compiles_cleanly(self):
+    root, counts = self.generate('tree', aliases=0.2, valid_through=0.2)
+    self.assertGreater(counts['divisions'], 2500)
+    self.assertLess(counts['divisions'], 10000)
+    self.assertGreater(counts['aliases'], 0)
+
+    result = compile.compile_country('zz', root=root, unique_fields=generate_synthetic.UNIQUE_FIELDS)
+    self.assertEqual(result.errors, [], compile.format_errors(result.errors))
+    self.assertEqual(len(result.records), counts['divisions'] + counts['aliases'])
+    self.assertEqual(result.records_with['census_geoid'], counts['census'])
+    self.assertEqual(result.unique_fields, ['census_geoid'])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import idtable  # noqa: E402
+
+
+class TestIdTable(unittest.TestCase):
+
+  def setUp(self):
+    self.tmpdir = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.tmpdir.name, 'test.idtable')
+
+  def tearDown(self):
+    self.tmpdir.cleanup()
+
+  def test_lookups(self):
+    items = sorted([
+        ('ocd-division/country:ca', 'Canada'),
+        ('ocd-division/country:ca/province:qc', 'Québec'),
+        ('ocd-division/country:ca/province:qc/ed:abitibi-est', 'Abitibi-Est'),
+        ('ocd-division/country:ca/province:on', 'Ontario'),
+        ('ocd-division/country:ca/province:on/cd:3501', ''),
+    ])
+    idtable.write_idtable(self.path, items)
+    with idtable.IdTable(self.path) as table:
+      self.assertEqual(len(table), len(items))
+      for key, value in items:
+        self.assertTrue(table.exists(key))
+        self.assertEqual(table.get(key), value)
+      for missing in ['', 'a', 'ocd-division/country:ca/province', 'ocd-division/country:ca/province:zz', '~']:
+        self.assertFalse(missing in table)
+        self.assertIsNone(table.get(missing))
+      self.assertEqual(list(table.items()), items)
+
+  def test_empty(self):
+    idtable.write_idtable(self.path, [])
+    with idtable.IdTable(self.path) as table:
+      self.assertEqual(len(table), 0)
+      self.assertFalse(table.exists('ocd-division/country:ca'))
+
+  def test_unsorted_keys_rejected(self):
+    with self.assertRaises(ValueError):
+      idtable.write_idtable(self.path, [('b', ''), ('a', '')])
+
+
+if __name__ == '__main__':
+  unittest.main()
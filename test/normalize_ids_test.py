@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import io
+import os
+import json
+import unittest
+
+from compiled_country import CompiledCountryTestCase  # also puts scripts/ on sys.path
+import normalize_ids
+
+
+class TestNormalizer(CompiledCountryTestCase):
+
+  OUTPUTS = {'canonical': True}
+
+  @classmethod
+  def setUpClass(cls):
+    super().setUpClass()
+    cls.write_country('eu', canonical=True)
+    corrections = os.path.join(cls.tmpdir.name, 'corrections')
+    os.makedirs(corrections)
+    cls.alias, cls.canonical = sorted((id_, same_as) for id_, same_as in cls.result.records.field_values('sameAs')
+                                      if same_as)[0]
+    with open(os.path.join(corrections, 'country-ca.csv'), 'w', encoding='UTF-8') as fh:
+      fh.write('incorrectId,id,note\n')
+      fh.write('ocd-division/country:ca/province:ont,ocd-division/country:ca/province:on,typo\n')
+      fh.write('{}.,{},stray period\n'.format(cls.alias, cls.alias))
+    cls.normalizer = normalize_ids.Normalizer(cls.identifiers, corrections)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.normalizer.close()
+    super().tearDownClass()
+
+  def test_statuses(self):
+    normalize = self.normalizer.normalize
+    self.assertEqual(normalize(' OCD-Division/Country:CA/Province:ON\n'),
+                     ('ocd-division/country:ca/province:on', normalize_ids.OK))
+    self.assertEqual(normalize('ocd-division/country:ca/province:ont'),
+                     ('ocd-division/country:ca/province:on', normalize_ids.CORRECTED))
+    self.assertEqual(normalize(self.alias), (self.canonical, normalize_ids.ALIASED))
+    self.assertEqual(normalize(self.alias + '.'), (self.canonical, normalize_ids.CORRECTED_ALIASED))
+    self.assertEqual(normalize('ocd-division/country:ca/province:zz'),
+                     ('ocd-division/country:ca/province:zz', normalize_ids.UNKNOWN))
+    self.assertEqual(normalize('ocd-division/country:xx/state:zz'),
+                     ('ocd-division/country:xx/state:zz', normalize_ids.UNKNOWN))
+    self.assertEqual(normalize('not an id'), ('not an id', normalize_ids.UNKNOWN))
+
+  def test_region(self):
+    normalize = self.normalizer.normalize
+    self.assertEqual(normalize('OCD-Division/Region:EU'), ('ocd-division/region:eu', normalize_ids.OK))
+    self.assertEqual(normalize('ocd-division/region:eu/state:zz'),
+                     ('ocd-division/region:eu/state:zz', normalize_ids.UNKNOWN))
+    self.assertEqual(normalize('ocd-division/planet:eu'), ('ocd-division/planet:eu', normalize_ids.UNKNOWN))
+
+  def test_csv(self):
+    infile = io.StringIO('name,id\nontario,ocd-division/country:ca/province:ont\nnowhere,\n')
+    outfile = io.StringIO()
+    counts = normalize_ids.normalize_csv(self.normalizer, infile, outfile)
+    self.assertEqual(outfile.getvalue(), 'name,id,normalized_id,status\n'
+                     'ontario,ocd-division/country:ca/province:ont,ocd-division/country:ca/province:on,corrected\n'
+                     'nowhere,,,unknown\n')
+    self.assertEqual(counts, {normalize_ids.CORRECTED: 1, normalize_ids.UNKNOWN: 1})
+    with self.assertRaises(ValueError):
+      normalize_ids.normalize_csv(self.normalizer, io.StringIO('ocdid\n'), io.StringIO())
+
+  def test_jsonl(self):
+    infile = io.StringIO('{"ocdid": "%s", "n": 1}\n\n{"n": 2}\n' % self.alias)
+    outfile = io.StringIO()
+    counts = normalize_ids.normalize_jsonl(self.normalizer, infile, outfile, column='ocdid')
+    records = [json.loads(line) for line in outfile.getvalue().splitlines()]
+    self.assertEqual(records, [
+        {'ocdid': self.alias, 'n': 1, 'normalized_id': self.canonical, 'status': normalize_ids.ALIASED},
+        {'n': 2, 'normalized_id': '', 'status': normalize_ids.UNKNOWN}])
+    self.assertEqual(counts, {normalize_ids.ALIASED: 1, normalize_ids.UNKNOWN: 1})
+
+  def test_missing_index(self):
+    identifiers = os.path.join(self.tmpdir.name, 'no_index')
+    os.makedirs(identifiers)
+    open(os.path.join(identifiers, 'country-ca.csv'), 'w').close()
+    with normalize_ids.Normalizer(identifiers, self.tmpdir.name) as normalizer:
+      with self.assertRaises(normalize_ids.MissingIndexError):
+        normalizer.normalize('ocd-division/country:ca')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import os
+import sys
+import json
+import types
+import asyncio
+import difflib
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+try:
+  import fuzzywuzzy  # noqa: F401
+except ImportError:
+  # ocdid only needs fuzzywuzzy to score names, and these tests check how the
+  # server routes requests, not the scores, so difflib stands in for it
+  def _ratio(a, b, full_process=True):
+    return int(round(100 * difflib.SequenceMatcher(None, a, b).ratio()))
+
+  def _extract_one(query, choices):
+    return max(((choice, _ratio(query, choice)) for choice in choices), key=lambda match: match[1], default=None)
+
+  fuzzywuzzy = types.ModuleType('fuzzywuzzy')
+  fuzzywuzzy.fuzz = types.SimpleNamespace(ratio=_ratio, WRatio=_ratio)
+  fuzzywuzzy.utils = types.SimpleNamespace(full_process=lambda s, force_ascii=False: s.lower().strip())
+  fuzzywuzzy.process = types.SimpleNamespace(extractOne=_extract_one)
+  sys.modules['fuzzywuzzy'] = fuzzywuzzy
+
+import ocdid  # noqa: E402
+import ocdid_loadtest  # noqa: E402
+import ocdid_server  # noqa: E402
+
+STATE = 'ocd-division/country:us/state:al'
+OCDID_ROWS = [
+    ['id', 'name'],
+    ['ocd-division/country:us', 'United States'],
+    [STATE, 'Alabama'],
+    [STATE + '/county:autauga', 'Autauga County'],
+    [STATE + '/county:marion', 'Marion County'],
+    [STATE + '/county:monroe', 'Monroe County'],
+]
+EXCEPTION_ROWS = [
+    ['incorrectId', 'id', 'note'],
+    [STATE + '/county:st._clair', STATE + '/county:marion', 'made up for the test'],
+]
+
+
+class ServerTestCase(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.data = ocdid.OcdidData(OCDID_ROWS, EXCEPTION_ROWS)
+    cls.server = ocdid_server.Server('unused')
+    cls.server.swap((cls.data, {}))
+
+  def dispatch(self, method, target, body=b''):
+    return asyncio.run(self.server.dispatch(method, target, body))
+
+
+class TestRunBatch(ServerTestCase):
+
+  def test_results_are_in_request_order(self):
+    requests = [
+        {'op': 'match_name', 'prefix': STATE, 'type': 'county', 'name': 'marion'},
+        {'op': 'is_ocdid', 'id': STATE},
+        {'op': 'get_exception', 'id': STATE + '/county:st._clair'},
+        {'op': 'match_name', 'prefix': STATE, 'type': 'county', 'name': 'monroe'},
+    ]
+    self.assertEqual(ocdid_server.run_batch(self.data, requests), [
+        {'result': dict(zip(('ocdid', 'ratio'), ocdid.match_name(STATE, 'county', 'marion', self.data)))},
+        {'result': True},
+        {'result': STATE + '/county:marion'},
+        {'result': dict(zip(('ocdid', 'ratio'), ocdid.match_name(STATE, 'county', 'monroe', self.data)))},
+    ])
+
+  def test_malformed_items_get_their_own_errors(self):
+    requests = [
+        {'op': 'match_name', 'prefix': ['not', 'a', 'string'], 'type': 'county', 'name': 'marion'},
+        {'op': 'match_name', 'prefix': {'a': 'dict'}, 'type': 'county', 'name': 'marion'},
+        {'op': 'match_name', 'prefix': STATE, 'type': 'county'},
+        {'op': 'match_name', 'prefix': STATE, 'type': 'ward', 'name': 'marion'},
+        {'op': ['match_name']},
+        'not a dict',
+        {'op': 'is_ocdid', 'id': 7},
+        {'op': 'match_name', 'prefix': STATE, 'type': 'county', 'name': 'marion'},
+    ]
+    results = ocdid_server.run_batch(self.data, requests)
+    self.assertEqual(results[:7], [
+        {'error': 'parameter must be a string: prefix'},
+        {'error': 'parameter must be a string: prefix'},
+        {'error': 'missing parameter: name'},
+        {'error': 'unknown prefix or type'},
+        {'error': "unknown op: ['match_name']"},
+        {'error': 'unknown op: None'},
+        {'error': 'parameter must be a string: id'},
+    ])
+    self.assertEqual(results[7]['result']['ocdid'], STATE + '/county:marion')
+
+  def test_requests_must_be_a_list(self):
+    with self.assertRaises(ocdid_server.RequestError) as raised:
+      ocdid_server.run_batch(self.data, {'op': 'is_ocdid'})
+    self.assertEqual(raised.exception.status, 400)
+
+
+class TestDispatch(ServerTestCase):
+
+  def test_get(self):
+    self.assertEqual(self.dispatch('GET', '/is_ocdid?id=' + STATE), {'result': True})
+    self.assertEqual(self.dispatch('GET', '/is_ocdid?id=' + STATE + '/county:nowhere'), {'result': False})
+
+  def test_batch(self):
+    body = json.dumps({'requests': [{'op': 'is_ocdid', 'id': STATE}, {'op': 'nope'}]}).encode('UTF-8')
+    self.assertEqual(self.dispatch('POST', '/batch', body),
+                     {'results': [{'result': True}, {'error': 'unknown op: nope'}]})
+
+  def test_errors(self):
+    for method, target, body, status in [
+        ('POST', '/batch', b'{"requests": [', 400),
+        ('POST', '/batch', b'["not", "an", "object"]', 400),
+        ('POST', '/batch', b'\xff', 400),
+        ('GET', '/batch', b'', 405),
+        ('GET', '/nowhere', b'', 404),
+        ('GET', '/is_ocdid', b'', 400),
+        ('POST', '/is_ocdid', b'{"id": ["a", "list"]}', 400),
+        ('POST', '/is_ocdid', b'not json', 400),
+        ('GET', '/match_name?prefix=ocd-division/country:zz&type=county&name=x', b'', 404),
+    ]:
+      with self.subTest(target=target, body=body):
+        with self.assertRaises(ocdid_server.RequestError) as raised:
+          self.dispatch(method, target, body)
+        self.assertEqual(raised.exception.status, status)
+
+  def test_status(self):
+    status = self.dispatch('GET', '/status')
+    self.assertEqual((status['files'], status['requests']), ([], 0))
+
+
+class TestLoadtestRequests(unittest.TestCase):
+
+  def test_batch_requests(self):
+    ids = [STATE + '/county:autauga', STATE + '/county:marion']
+    [(method, path, body)] = ocdid_loadtest.make_requests('batch', ids, 1, 3)
+    self.assertEqual((method, path), ('POST', '/batch'))
+    self.assertEqual([request['name'] for request in json.loads(body)['requests']],
+                     ['autauga', 'marion', 'autauga'])
+
+
+if __name__ == '__main__':
+  unittest.main()
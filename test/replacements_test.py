@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from replacements import ReplacementTable  # noqa: E402
+
+
+def sequential(pairs, value):
+  for old, new in pairs:
+    value = value.replace(old, new)
+  return value
+
+
+class TestReplacementTable(unittest.TestCase):
+
+  def test_ordered_precedence(self):
+    table = ReplacementTable((('Twenty-First', '21st'), ('First', '1st'), (' District', '')))
+    self.assertEqual(table.apply('Twenty-First District'), '21st')
+    self.assertEqual(table('First District'), '1st')
+    self.assertEqual(table('Nothing to do'), 'Nothing to do')
+
+  def test_replacements_see_earlier_output(self):
+    # 'Ward ' is removed before 'HD-' is looked for, joining 'H' and 'D-'
+    table = ReplacementTable((('Ward ', ''), ('HD-', 'x'), ('x', 'y'), ('HD', 'z')))
+    self.assertEqual(table('HWard D-1 HD'), sequential(table.pairs, 'HWard D-1 HD'))
+    self.assertEqual(table('HWard D-1 HD'), 'y1 z')
+
+  def test_hidden_keys(self):
+    # 'bc' only occurs overlapping the 'ab' the scan reports
+    pairs = (('bc', 'X'), ('ab', 'Y'))
+    self.assertEqual(ReplacementTable(pairs)('abc'), 'aX')
+
+  def test_matches_sequential_replace(self):
+    rng = random.Random(0)
+    for _ in range(2000):
+      pairs = [(''.join(rng.choice('abc') for _ in range(rng.randint(1, 3))),
+                ''.join(rng.choice('abc') for _ in range(rng.randint(0, 3))))
+               for _ in range(rng.randint(1, 6))]
+      table = ReplacementTable(pairs, cache_size=0)
+      for _ in range(10):
+        value = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 12)))
+        self.assertEqual(table(value), sequential(pairs, value), (pairs, value))
+
+  def test_empty_key(self):
+    with self.assertRaises(ValueError):
+      ReplacementTable((('', 'x'),))
+
+
+if __name__ == '__main__':
+  unittest.main()
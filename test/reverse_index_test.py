@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+# Run this test from the root of the repository, as:
+# $ bazel test :all --test_output=errors
+
+import os
+import unittest
+
+from compiled_country import CompiledCountryTestCase  # also puts scripts/ on sys.path
+import compile
+import idtable
+
+
+class TestReverseIndex(CompiledCountryTestCase):
+
+  OUTPUTS = {'reverse_index': True}
+
+  def test_one_table_per_present_unique_field(self):
+    for field in compile.COUNTRY_UNIQUE_FIELDS['ca']:
+      path = compile.reverse_index_path(self.output_file, field)
+      self.assertEqual(os.path.exists(path), field in self.result.field_order, path)
+
+  def test_codes_map_to_ids(self):
+    for field in compile.COUNTRY_UNIQUE_FIELDS['ca']:
+      path = compile.reverse_index_path(self.output_file, field)
+      if field not in self.result.field_order:
+        continue
+      expected = {value: id_ for id_, value in self.result.records.field_values(field)}
+      with idtable.IdTable(path) as table:
+        self.assertEqual(len(table), len(expected))
+        self.assertEqual(dict(table.items()), expected)
+        for value, id_ in expected.items():
+          self.assertEqual(table.get(value), id_)
+        self.assertIsNone(table.get('no such code'))
+
+if __name__ == '__main__':
+  unittest.main()